@@ -7,9 +7,64 @@ llm_model = {
         "api_key": "sk-8IGJQBsUBzTbXmNACeAdB3B2Af8344A9B4179040B5814cDf",
         "openai_proxy": "",
         "type": "instruction",
+        "rpm": 300,         # 每分钟请求数上限，不配置则不限流
+        "tpm": 600000,      # 每分钟token数上限（输入+输出）
+        # 可选：多个等价的后端（不同网关或API key），配置后按负载与延迟路由，
+        # 未配置时使用上面的api_base_url/api_key；每个后端可单独指定rpm/tpm，缺省沿用上面的配置
+        # "backends": [
+        #     {"api_base_url": "https://one-api.maas.com.cn/v1/", "api_key": "sk-..."},
+        #     {"api_base_url": "https://api.deepseek.com/v1/", "api_key": "sk-...", "rpm": 60},
+        # ],
     }
 }
 
+# 多后端路由：连续失败failure_threshold次的后端摘除eject_seconds秒
+LLM_ROUTING = {
+    "failure_threshold": 3,
+    "eject_seconds": 30,
+}
+
+# 各角色单次LLM调用的截止时间（秒），超时的调用按失败处理，不阻塞整轮迭代
+LLM_DEADLINES = {
+    "agent": 90,        # 国家agent生成完整响应
+    "bid": 20,          # 竞价阶段
+    "context": 120,     # 上下文agent更新经济数据
+    "summary": 60,      # 记忆摘要
+}
+
+# 对冲请求（可选，默认关闭）：调用超过近期延迟的percentile分位仍未返回时，再发起一个相同请求，取先返回者；
+# 开启后约有(1-percentile)的调用会多消耗一次请求与token配额
+LLM_HEDGING = {
+    "enabled": False,
+    "percentile": 0.95,
+    "min_samples": 20,      # 样本不足时不对冲
+    "min_delay": 2.0,       # 对冲延迟下限（秒）
+    "max_delay": 30.0,
+    "window": 200,          # 统计最近多少次调用的延迟
+}
+
+# LLM响应缓存：相同模型、参数与消息的请求直接复用已有结果
+LLM_CACHE = {
+    "enabled": True,
+    "max_entries": 512,             # 内存LRU容量
+    "ttl": 7 * 24 * 3600,           # 过期时间（秒）
+    "disk_dir": "data/llm_cache",   # 磁盘缓存目录，为空时只使用内存
+    "disk_max_entries": 10000,
+}
+
+# 合并相同的在途LLM请求：并发的相同请求只向服务商发起一次调用
+LLM_SINGLE_FLIGHT = True
+
+# 所有模型共用的HTTP连接池
+LLM_HTTP_CLIENT = {
+    "max_connections": 100,             # 连接总数上限
+    "max_keepalive_connections": 20,    # 保持空闲的长连接数
+    "keepalive_expiry": 30,             # 空闲长连接的保留时间（秒）
+    "timeout": 120,
+    "connect_timeout": 10,
+    "http2": False,                     # 需要安装h2
+}
+
 embed_model = {
     "default": {
         "model_name": "",
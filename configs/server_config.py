@@ -6,4 +6,27 @@ DEFAULT_BIND_HOST = "0.0.0.0" if sys.platform != "win32" else "127.0.0.1"
 API_SERVER = {
     "host": DEFAULT_BIND_HOST,
     "port": 6010,
-}
\ No newline at end of file
+    # 收到退出信号后等待运行中的模拟结束的最长时间（秒），超时的运行中止，可之后从检查点恢复
+    "drain_timeout": 600,
+    # 以SO_REUSEPORT监听，新进程可与正在排空的旧进程同时绑定端口，实现不中断重启
+    "reuse_port": True,
+    # /start运行真实模拟（调用LLM，支持共享运行与断线取消）；关闭时/start回放已录制的trace
+    "live_start": False,
+}
+
+# 后台模拟任务（POST /simulations）
+SIMULATION_JOBS = {
+    "max_workers": 4,           # 同时运行的模拟数
+    "max_queued": 8,            # 排队等待的模拟数，超过后返回429
+    "retry_after": 30,          # 无历史耗时可参考时建议的重试等待（秒）
+    "buffer_events": 2000,      # 每个模拟在内存中保留的最近事件数，更早的事件从运行记录补齐
+    "retention": 600,           # 结束的模拟保留多久（秒）以供重新订阅
+    "heartbeat": 15,            # 无新事件时发送SSE心跳的间隔（秒）
+}
+
+# 共享运行：参数相同的/start请求订阅同一个正在进行的模拟，事件只产生一次再分发给所有观众
+BROADCAST = {
+    "share_start": True,        # /start默认加入正在进行的共享运行
+    "queue_size": 256,          # 每个观众的增量事件队列上限
+    "policy": "coalesce",       # 慢观众策略："coalesce" 合并增量；"drop_oldest" 丢弃最早的增量、跳到最新进度，只保证完整事件
+}
@@ -9,6 +9,105 @@ stimulus_inducer = {
 MIN_SCORE_THRESHOLD = 50
 MAX_ITERATIONS = 3
 
+# 流式输出：开启后agent以token流方式生成，/start实时推送action_detail增量
+STREAM_AGENT_OUTPUT = False
+
+# 提前取消：流式读取到score后，取消已低于本轮最高分的agent的生成（当前领先者不会被取消）
+EARLY_CANCEL_LOW_SCORES = True
+
+# agent回合模式："single" 每个agent直接生成完整响应；
+# "bid" 先以小token预算竞价（score+action），只有最高分agent再生成完整的action_detail
+AGENT_TURN_MODE = "single"
+BID_MAX_TOKENS = 64
+
+# agent输出无法解析为JSON时，要求模型纠正的最大重试次数
+RESPONSE_MAX_RETRIES = 1
+
+# 迭代推进策略：收到quorum个响应或超过deadline秒后即进入宣布阶段，不再等待其余agent
+# quorum为响应agent的比例（0~1，向上取整）；quorum_count为个数，设置后优先于quorum；deadline为None时不限时
+# late_policy: "drop" 直接取消未完成的响应；"fold" 允许其在后台完成，下一轮开始前写入该agent的记忆
+ITERATION_QUORUM = {
+    "quorum": 1.0,
+    "quorum_count": None,
+    "deadline": None,
+    "late_policy": "fold",
+}
+
+# 经济指标的schema，上下文按各国指标名匹配schema，并以该顺序存为(国家, 指标, 迭代)数组
+INDICATOR_SCHEMAS = {
+    "macro": ["GDP", "失业率", "通胀率"],
+    "automotive": [
+        "import_value_billion_usd", "import_change_pct",
+        "export_value_billion_usd", "export_change_pct",
+        "market_share_pct", "market_share_change_pct",
+        "annual_production_ten_thousand_vehicles", "annual_production_change_pct",
+        "demand_ten_thousand_vehicles", "demand_change_pct",
+        "production_cost_ten_thousand_usd", "production_cost_change_pct",
+    ],
+}
+
+# 经济上下文的更新方式："llm" 由ContextAgent调用模型分析；"numeric" 按IMPACT_RULES的系数直接计算，结果可复现；
+# "hybrid" 能识别的行动按系数计算，无法识别的行动再交给模型
+CONTEXT_UPDATE_MODE = "llm"
+
+# ContextAgent调用模型时的输出格式："full" 返回所有国家的完整指标，缺少任一国家即整体作废；
+# "delta" 只返回发生变化的(国家, 指标, 变化量)，在本地逐条校验后叠加，部分有效的回答也会被采纳
+CONTEXT_LLM_OUTPUT = {
+    "format": "full",
+    "max_rel_delta": 0.5,       # 单条变化量绝对值不超过当前值绝对值的该比例，超出的条目视为无效
+    "min_delta_cap": 5.0,       # 当前值接近0或缺失时变化量绝对值的上限
+}
+
+# 数值影响引擎的行动目录，对应各国agent可执行策略表中的行动，系数取ContextAgent提示词中参考区间的中值
+# 行动名称与action一致或包含任一alias即命中（按顺序取第一条）；variants的关键词出现在行动名称中（不含目录名称本身，
+# 且前面没有否定词）时改用变体系数，行动详情不参与分类
+# self作用于行动国，target作用于行动详情中提及的其他国家，未提及时作用于所有其他国家
+IMPACT_RULES = [
+    {"action": "观望", "aliases": ["观望", "维持现状"]},
+    {"action": "实施报复性关税", "aliases": ["报复", "反制"],
+     "self": {"GDP": -0.1, "失业率": 0.2}, "target": {"GDP": -0.2},
+     "variants": [{"keywords": ["降低", "下调", "取消", "撤销", "暂停"], "self": {"通胀率": -0.1}, "target": {"GDP": 0.1}}]},
+    {"action": "设定/更改关税", "aliases": ["关税"],
+     "self": {"通胀率": 0.2}, "target": {"GDP": -0.2},
+     "variants": [{"keywords": ["降低", "下调", "取消", "撤销", "暂停", "豁免"], "self": {"通胀率": -0.1}, "target": {"GDP": 0.1}}]},
+    {"action": "设置贸易限制", "aliases": ["限制", "禁令", "管制"],
+     "self": {"失业率": 0.1}, "target": {"GDP": -0.15}},
+    {"action": "提供补贴", "aliases": ["补贴"],
+     "self": {"通胀率": 0.1, "失业率": -0.1}},
+    {"action": "提出/接受/拒绝谈判让步", "aliases": ["让步", "减让"],
+     "self": {"GDP": 0.05}, "target": {"GDP": 0.1},
+     "variants": [{"keywords": ["拒绝"]}]},
+    {"action": "发起/响应谈判", "aliases": ["谈判", "磋商", "对话"],
+     "self": {"GDP": 0.05}, "target": {"GDP": 0.05}},
+    {"action": "建立/加入/退出联盟", "aliases": ["联盟", "同盟"],
+     "self": {"GDP": 0.2, "失业率": -0.1}, "target": {"GDP": 0.1},
+     "variants": [{"keywords": ["退出"], "self": {"GDP": -0.15}, "target": {"GDP": -0.05}}]},
+    {"action": "寻求对冲性合作 (新贸易协定)", "aliases": ["对冲", "协定", "合作"],
+     "self": {"GDP": 0.1, "失业率": -0.05}, "target": {"GDP": 0.05}},
+]
+
+# agent历史记忆：最近记录原文保留，更早的记录在后台合并为摘要
+AGENT_MEMORY = {
+    "token_budget": 1500,       # 历史记忆渲染后的总token预算
+    "recent_tokens": 1000,      # 原文保留的最近记录的token预算
+    "summarize": True,          # 是否用LLM生成摘要，关闭时旧记录只做截断压缩
+}
+
+# 运行录制与回放
+REPLAY = {
+    "trace_dir": "traces",      # trace文件目录，每个运行一个<run_id>.jsonl
+    "speed": 1.0,               # 默认回放速度倍率，1为原始录制节奏
+    "record_live_runs": False,  # 是否将/start的真实运行录制为trace
+}
+
+# 运行结果持久化：/start的每次运行及其事件写入SQLite，可按运行、迭代或时间范围查询
+RUN_STORE = {
+    "enabled": True,
+    "path": "data/runs.db",
+    "batch_size": 100,          # 后台线程每批最多写入的记录数
+    "flush_interval": 0.5,      # 每批最长等待时间（秒）
+}
+
 context = {
     "us": {
         "GDP": 21,
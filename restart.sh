@@ -1,14 +1,48 @@
 PORT=6010
+# 旧进程排空的最长等待时间（秒），应不小于startup.py的--drain-timeout
+DRAIN_WAIT=660
 
-PID=$(lsof -i :$PORT -sTCP:LISTEN -t)
+OLD_PID=$(lsof -i :$PORT -sTCP:LISTEN -t)
 
-if [ -n "$PID" ]; then
-    echo "找到监听 $PORT 的进程 PID: $PID，正在终止..."
-    kill $PID
-    echo "进程 $PID 已终止。"
-else
-    echo "未找到监听端口 $PORT 的进程。"
+# 新进程以SO_REUSEPORT与旧进程同时监听端口，就绪后旧进程再开始排空，端口不会出现关闭窗口
+nohup python startup.py --all-api 2>&1 &
+NEW_PID=$!
+echo "已启动新进程 PID: $NEW_PID，等待其监听 $PORT ..."
+
+READY=""
+for i in $(seq 1 60); do
+    if ! kill -0 $NEW_PID 2>/dev/null; then
+        break
+    fi
+    if lsof -a -p $NEW_PID -i :$PORT -sTCP:LISTEN -t >/dev/null 2>&1; then
+        READY=1
+        break
+    fi
+    sleep 1
+done
+
+if [ -z "$READY" ]; then
+    # 旧进程未开启SO_REUSEPORT时新进程无法绑定，退回先停旧进程再启动
+    echo "新进程未能监听端口 $PORT，改为停止旧进程后重启"
+    kill $NEW_PID 2>/dev/null
+    sh shutdown.sh
+    nohup python startup.py --all-api 2>&1 &
+    exit 0
 fi
-sleep 3
 
-nohup python startup.py --all-api 2>&1 &
\ No newline at end of file
+if [ -n "$OLD_PID" ]; then
+    for PID in $OLD_PID; do
+        echo "新进程已就绪，通知旧进程 $PID 排空..."
+        # SIGTERM触发排空：拒绝新的模拟，运行中的模拟继续推送直到结束或超时
+        kill -TERM $PID
+    done
+    # 旧进程在后台自行退出，超时未退出的强制结束
+    (
+        sleep $DRAIN_WAIT
+        for PID in $OLD_PID; do
+            kill -0 $PID 2>/dev/null && kill -9 $PID
+        done
+    ) >/dev/null 2>&1 &
+else
+    echo "未找到旧进程。"
+fi
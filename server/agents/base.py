@@ -1,6 +1,25 @@
-from langchain.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from server.utils import get_ChatOpenAI, extract_pure_json
+import asyncio
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from typing import Callable, Dict, List, Optional, Tuple
+from configs import BID_MAX_TOKENS, RESPONSE_MAX_RETRIES
+from server.agents.response import AgentResponse, response_parser
+from server.utils import get_ChatOpenAI, extract_usage, IncrementalJsonReader
+
+# 竞价阶段追加的说明，只要求返回score与action
+BID_INSTRUCTION = """
+
+本轮为竞价阶段：只需给出执行意愿得分与行动名称，不要输出action_detail。
+返回格式：{"score": "执行意愿得分（0-100）", "action": "最符合当前国情的行动名称"}"""
+
+# 竞价胜出后追加的说明，要求给出完整行动内容
+DETAIL_INSTRUCTION = "\n\n你已决定执行「{action}」（执行意愿得分：{score}），请按返回内容格式给出详细的行动内容。"
+
+# 输出无法解析时的纠正提示，原输出作为上一轮回复保留在对话中
+CORRECTION_INSTRUCTION = "你上面的回复不是有效的JSON或缺少字段{fields}。请只返回一个JSON对象，不要输出其他内容。"
+
+RESPONSE_FIELDS = ("score", "action", "action_detail")
+BID_FIELDS = ("score", "action")
 
 
 class BaseAgent:
@@ -8,29 +27,123 @@ class BaseAgent:
         # 原有初始化代码保持不变
         self.name = agent_name
         self.prompt_template = system_prompt  # 保存原始模板
+        # 固定的系统提示词在前，历史轮次按消息追加，本轮输入在最后，便于复用前缀缓存
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", system_prompt),
+            MessagesPlaceholder("history", optional=True),
             ("human", "{input}")
         ])
-        self.model = get_ChatOpenAI(model_name)
-        self.chain = self.prompt | self.model | StrOutputParser()
+        self.model = get_ChatOpenAI(model_name, role="agent")
+        self.chain = self.prompt | self.model
+        # 竞价只需要极少的输出，使用单独的小token预算模型
+        self.bid_model = get_ChatOpenAI(model_name, max_tokens=BID_MAX_TOKENS, role="bid")
+        self.bid_chain = self.prompt | self.bid_model
 
     def _retrieve_context(self, query: str) -> str:
         """检索相关上下文（需要子类实现）"""
         raise NotImplementedError("子类必须实现_retrieve_context方法")
 
-    async def start(self, input: str, context=None) -> str:
-        """处理输入并返回JSON响应，可选择传入最新上下文"""
-        if context:
-            # 使用最新上下文构建当前状态信息
-            current_state = self._format_context(context)
-            # 在输入中添加上下文信息
-            enhanced_input = f"当前状态：\n{current_state}\n\n{input}"
-        else:
-            enhanced_input = input
-
-        response = await self.chain.ainvoke({"input": enhanced_input})
-        return extract_pure_json(response)
+    async def start(self, input: str, context=None,
+                    history: Optional[List[BaseMessage]] = None,
+                    on_delta: Optional[Callable[[str, str], None]] = None,
+                    should_stop: Optional[Callable[[Dict], bool]] = None) -> AgentResponse:
+        """处理输入并返回校验后的响应，可选择传入最新上下文与历史对话消息
+
+        传入on_delta或should_stop时以流式方式调用模型：
+        on_delta在每收到一段字段文本时回调(字段名, 增量文本)；
+        should_stop接收已解析完成的字段，返回True时立即中止生成，
+        并返回已解析的部分字段（带cancelled标记）。
+        超过截止时间时返回已解析的部分字段（带timed_out标记）。
+        输出无法解析时最多纠正重试RESPONSE_MAX_RETRIES次。
+        返回结果的usage字段记录本次调用的token用量（含命中前缀缓存的token数）
+        """
+        inputs = {"input": self.build_input(input, context), "history": history or []}
+
+        if on_delta is None and should_stop is None:
+            try:
+                message = await self.chain.ainvoke(inputs)
+            except asyncio.TimeoutError:
+                print(f"警告: {self.name} 响应超时")
+                return AgentResponse(timed_out=True, parse_path="partial")
+            return await self._finalize(self.chain, inputs, message, RESPONSE_FIELDS)
+
+        reader = IncrementalJsonReader()
+        message = None
+        try:
+            async for chunk in self.chain.astream(inputs):
+                message = chunk if message is None else message + chunk
+                for key, text in reader.feed(chunk.content):
+                    if on_delta is not None:
+                        on_delta(key, text)
+                # 提前退出流会关闭底层连接，后续token不再生成
+                if should_stop is not None and not reader.done and should_stop(reader.values):
+                    return AgentResponse.from_dict(reader.values, cancelled=True, parse_path="partial")
+        except asyncio.TimeoutError:
+            print(f"警告: {self.name} 响应超时")
+            return AgentResponse.from_dict(reader.values, timed_out=True, parse_path="partial")
+        if message is None:
+            return AgentResponse(parse_path="failed")
+        return await self._finalize(self.chain, inputs, message, RESPONSE_FIELDS)
+
+    async def bid(self, input: str, context=None, history: Optional[List[BaseMessage]] = None) -> AgentResponse:
+        """竞价阶段：以很小的token预算只返回score与action"""
+        inputs = {
+            "input": self.build_input(input, context) + BID_INSTRUCTION,
+            "history": history or []
+        }
+        try:
+            message = await self.bid_chain.ainvoke(inputs)
+        except asyncio.TimeoutError:
+            print(f"警告: {self.name} 竞价超时")
+            return AgentResponse(timed_out=True, parse_path="partial")
+        return await self._finalize(self.bid_chain, inputs, message, BID_FIELDS)
+
+    async def detail(self, input: str, bid: AgentResponse, context=None,
+                     history: Optional[List[BaseMessage]] = None,
+                     on_delta: Optional[Callable[[str, str], None]] = None) -> AgentResponse:
+        """竞价胜出后生成完整响应，score沿用竞价结果；解析成功时action也沿用竞价结果，失败时保持为空"""
+        instruction = DETAIL_INSTRUCTION.format(action=bid.action, score=bid.score)
+        response = await self.start(self.build_input(input, context) + instruction, history=history, on_delta=on_delta)
+        response.score = bid.score
+        if response.parse_path != "failed":
+            response.action = bid.action
+        return response
+
+    async def _finalize(self, chain, inputs: Dict, message, fields: Tuple[str, ...]) -> AgentResponse:
+        """解析模型输出，失败时把原输出留在对话中并要求模型纠正，重试次数受RESPONSE_MAX_RETRIES限制"""
+        usage = extract_usage(message)
+        data, path = response_parser.parse(message.content)
+        for _ in range(RESPONSE_MAX_RETRIES):
+            if data is not None:
+                break
+            response_parser.counters["retry"] += 1
+            inputs = {
+                "input": CORRECTION_INSTRUCTION.format(fields="、".join(fields)),
+                "history": inputs["history"] + [HumanMessage(content=inputs["input"]), AIMessage(content=message.content)]
+            }
+            try:
+                message = await chain.ainvoke(inputs)
+            except asyncio.TimeoutError:
+                break
+            usage = {key: value + extract_usage(message)[key] for key, value in usage.items()}
+            data, path = response_parser.parse(message.content)
+            if data is not None:
+                response_parser.counters["retry_success"] += 1
+                path = "retry"
+
+        if data is None:
+            response_parser.counters["failed"] += 1
+            print(f"警告: {self.name} 的输出无法解析: {message.content[:80]}")
+            return AgentResponse(usage=usage, parse_path="failed")
+        return AgentResponse.from_dict(data, usage=usage, parse_path=path)
+
+    def build_input(self, input: str, context=None) -> str:
+        """在输入前附加当前状态信息"""
+        if not context:
+            return input
+        # 使用最新上下文构建当前状态信息
+        current_state = self._format_context(context)
+        return f"当前状态：\n{current_state}\n\n{input}"
 
     def _format_context(self, context):
         """格式化上下文数据，可由子类重写以自定义格式"""
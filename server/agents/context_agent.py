@@ -1,14 +1,40 @@
-from typing import Dict, List
+import asyncio
+import copy
+import math
+from typing import Callable, Dict, List, Optional
+import numpy as np
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from configs import CONTEXT_UPDATE_MODE, CONTEXT_LLM_OUTPUT, IMPACT_RULES
+from server.agents.impact import ImpactEngine
+from server.indicators import IndicatorSnapshot, IndicatorState
 from server.utils import get_ChatOpenAI, extract_pure_json
 
+CONTEXT_MODES = ("llm", "numeric", "hybrid")
+# delta格式下绝对值小于该值的指标视为0，变化量上限取min_delta_cap
+NEAR_ZERO = 1e-6
+
 
 class ContextAgent:
-    def __init__(self, initial_context: Dict, model_name: str = "gpt-3.5-turbo"):
+    """根据行动更新各国经济指标，mode见CONTEXT_UPDATE_MODE，output_format见CONTEXT_LLM_OUTPUT"""
+
+    def __init__(self, initial_context: Dict, model_name: str = "gpt-3.5-turbo", mode: str = CONTEXT_UPDATE_MODE,
+                 output_format: str = CONTEXT_LLM_OUTPUT["format"],
+                 max_rel_delta: float = CONTEXT_LLM_OUTPUT["max_rel_delta"],
+                 min_delta_cap: float = CONTEXT_LLM_OUTPUT["min_delta_cap"]):
+        if mode not in CONTEXT_MODES:
+            raise ValueError(f"Unknown context update mode: {mode}")
+        if output_format not in ("full", "delta"):
+            raise ValueError(f"Unknown context output format: {output_format}")
         self.name = "context_agent"
-        self._context = initial_context.copy()  # 存储上下文数据
-        self.system_prompt = """你是一个世界经济影响分析专家。
+        self.mode = mode
+        self.output_format = output_format
+        self.max_rel_delta = max_rel_delta
+        self.min_delta_cap = min_delta_cap
+        self._state = IndicatorState.from_context(initial_context)  # 存储上下文数据及逐轮历史
+        # 按指标顺序缓存的数值引擎，fork出的副本共享
+        self._engines: Dict[tuple, ImpactEngine] = {}
+        reference = """你是一个世界经济影响分析专家。
 根据给定的行动和当前经济数据，分析并更新各国经济指标。
 国家行动会对本国和其他国家产生影响。请基于经济学原理进行合理的数据调整。
 
@@ -19,7 +45,23 @@ class ContextAgent:
 - 退出贸易联盟: 短期内可能降低GDP(-0.1~0.2)
 - 设置贸易限制: 对本国可能提高失业率(+0.1)，对目标国降低GDP(-0.1~0.2)
 - 提供补贴: 可能提高通胀率(+0.1)，降低失业率(-0.1)
+"""
+        if output_format == "delta":
+            self.system_prompt = reference + """
+评估当前行动影响，只返回发生变化的指标及其变化量delta（新值减旧值），格式为JSON。
+country与indicator必须使用用户输入中的国家名与指标名，没有变化的指标不要输出；
+行动对经济数据没有影响时返回{{"changes": []}}。
 
+例如:
+{{
+  "changes": [
+    {{"country": "china", "indicator": "GDP", "delta": -0.2}},
+    {{"country": "us", "indicator": "通胀率", "delta": 0.1}}
+  ]
+}}
+"""
+        else:
+            self.system_prompt = reference + """
 评估当前行动影响并返回更新后的完整经济数据，格式为JSON。
 禁止输出用户输入中没有提及的国家及参数。
 
@@ -33,19 +75,43 @@ class ContextAgent:
             ("system", self.system_prompt),
             ("human", "{input}")
         ])
-        self.model = get_ChatOpenAI(model_name)
+        self.model = get_ChatOpenAI(model_name, role="context")
         self.chain = self.prompt | self.model | StrOutputParser()
 
-    def get_context(self) -> Dict:
-        """获取当前上下文数据"""
-        return self._context.copy()
+    def fork(self, initial_context: Dict, mode: Optional[str] = None) -> "ContextAgent":
+        """复用prompt、模型与数值引擎，创建持有独立上下文的副本，mode为空时沿用原有更新方式"""
+        if mode is not None and mode not in CONTEXT_MODES:
+            raise ValueError(f"Unknown context update mode: {mode}")
+        agent = copy.copy(self)
+        agent._state = IndicatorState.from_context(initial_context)
+        agent.mode = mode or self.mode
+        return agent
+
+    @property
+    def state(self) -> IndicatorState:
+        return self._state
+
+    def get_context(self) -> IndicatorSnapshot:
+        """获取当前上下文数据的只读快照"""
+        return self._state.current()
+
+    def commit_round(self) -> IndicatorSnapshot:
+        """一轮迭代结束，把当前数据记入历史并返回该轮快照"""
+        return self._state.commit()
+
+    @property
+    def engine(self) -> ImpactEngine:
+        indicators = self._state.indicators
+        if indicators not in self._engines:
+            self._engines[indicators] = ImpactEngine(IMPACT_RULES, indicators)
+        return self._engines[indicators]
 
     @staticmethod
     def _format_context(context: Dict) -> str:
         """格式化上下文数据为易读形式"""
         lines = []
         for country, data in context.items():
-            lines.append(f"{country}: GDP={data['GDP']}, 失业率={data['失业率']}, 通胀率={data['通胀率']}")
+            lines.append(f"{country}: " + ", ".join(f"{key}={value}" for key, value in data.items()))
         return "\n".join(lines)
 
     @staticmethod
@@ -61,7 +127,7 @@ class ContextAgent:
 
             # 检查每个国家是否包含所有必要指标
             country_data = context[country]
-            if not all(key in country_data for key in ['GDP', '失业率', '通胀率']):
+            if not isinstance(country_data, dict) or not all(key in country_data for key in original_context[country]):
                 return False
 
         return True
@@ -75,8 +141,23 @@ class ContextAgent:
                 target_countries.append(country)
         return target_countries
 
-    async def update_context(self, action_agent: str, action: str, action_detail: str) -> None:
-        """根据agent的行动更新经济上下文数据"""
+    async def update_context(self, action_agent: str, action: str, action_detail: str,
+                             on_delta: Optional[Callable[[str], None]] = None) -> None:
+        """根据agent的行动更新经济上下文数据，传入on_delta时逐段回调模型输出
+
+        numeric与hybrid模式下先按系数计算，能识别的行动不调用模型；
+        numeric模式下无法识别的行动不改变数据，hybrid模式下交给模型分析
+        """
+        if self.mode != "llm":
+            values, unrecognized = self.engine.apply(self._state.values, self._state.countries,
+                                                     [(action_agent, action, action_detail)])
+            if not unrecognized:
+                self._state.update(values)
+                return
+            if self.mode == "numeric":
+                print(f"警告: 无法识别的行动 {action}，保持原始数据")
+                return
+
         # 构建输入信息
         input_text = f"""
 行动agent: {action_agent}
@@ -84,19 +165,76 @@ class ContextAgent:
 行动详情: {action_detail}
 
 当前经济数据:
-{self._format_context(self._context)}
+{self._format_context(self.get_context())}
 
-请分析此行动对各国经济指标的影响，并返回更新后的完整经济数据。
+{"请分析此行动对各国经济指标的影响，只返回发生变化的指标。" if self.output_format == "delta" else "请分析此行动对各国经济指标的影响，并返回更新后的完整经济数据。"}
 """
         # 获取LLM的响应
-        response = await self.chain.ainvoke({"input": input_text})
+        try:
+            if on_delta is None:
+                response = await self.chain.ainvoke({"input": input_text})
+            else:
+                chunks = []
+                async for chunk in self.chain.astream({"input": input_text}):
+                    chunks.append(chunk)
+                    on_delta(chunk)
+                response = "".join(chunks)
+        except asyncio.TimeoutError:
+            print("警告: 上下文更新超时，保持原始数据")
+            return
+        if self.output_format == "delta":
+            self._apply_changes(extract_pure_json(response))
+            return
+
         # 解析JSON格式的响应
         updated_context = extract_pure_json(response)
 
         # 验证返回的数据格式
-        if not self._validate_context_format(updated_context, self._context):
+        if not self._validate_context_format(updated_context, self.get_context()):
             print("警告: 上下文格式无效，保持原始数据")
             return
 
-        # 更新内部状态
-        self._context = updated_context
\ No newline at end of file
+        # 更新内部状态，只取已知国家与指标
+        try:
+            self._state.update(updated_context)
+        except (TypeError, ValueError):
+            print("警告: 上下文包含空值或非数字，本次更新作废，保持原始数据")
+
+    def _apply_changes(self, payload) -> None:
+        """逐条校验模型返回的(国家, 指标, 变化量)并叠加到当前数据，无效条目丢弃，其余照常生效"""
+        changes = payload.get("changes") if isinstance(payload, dict) else payload
+        if not isinstance(changes, list):
+            print("警告: 上下文变化格式无效，保持原始数据")
+            return
+        countries = {country: i for i, country in enumerate(self._state.countries)}
+        indicators = {name: j for j, name in enumerate(self._state.indicators)}
+        rows, columns, deltas = [], [], []
+        rejected = 0
+        for change in changes:
+            try:
+                i = countries[change["country"]]
+                j = indicators[change["indicator"]]
+                delta = float(change["delta"])
+            except (KeyError, TypeError, ValueError):
+                rejected += 1
+                continue
+            # 上限按当前值的比例计算，当前值接近0或缺失时取min_delta_cap
+            current = self._state.values[i, j]
+            if math.isfinite(current) and abs(current) >= NEAR_ZERO:
+                cap = self.max_rel_delta * abs(current)
+            else:
+                cap = self.min_delta_cap
+            if not math.isfinite(delta) or abs(delta) > cap:
+                rejected += 1
+                continue
+            rows.append(i)
+            columns.append(j)
+            deltas.append(delta)
+        if rejected:
+            print(f"警告: 丢弃{rejected}条无效的上下文变化，采纳{len(deltas)}条")
+        if not deltas:
+            return
+        values = self._state.values.copy()
+        # 同一指标出现多次时累加
+        np.add.at(values, (rows, columns), deltas)
+        self._state.update(np.round(values, 2))
@@ -0,0 +1,113 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# 行动详情中识别目标国家用的名称
+COUNTRY_ALIASES = {
+    "us": ("us", "usa", "美国", "美方"),
+    "china": ("china", "中国", "中方"),
+    "canada": ("canada", "加拿大", "加方"),
+    "vietnam": ("vietnam", "越南", "越方"),
+}
+
+# 出现在关键词前面时表示否定，如"暂不取消"、"未退出"
+NEGATIONS = ("不", "未", "无", "非", "勿", "没")
+
+
+def _mentions(text: str, keyword: str) -> bool:
+    """keyword出现在text中且前面两个字内没有否定词"""
+    start = text.find(keyword)
+    while start != -1:
+        if not any(negation in text[max(start - 2, 0):start] for negation in NEGATIONS):
+            return True
+        start = text.find(keyword, start + 1)
+    return False
+
+
+class ImpactEngine:
+    """按行动系数计算经济指标变化的数值引擎
+
+    rules为IMPACT_RULES格式的行动目录，编译为(效果数, 指标数)的系数矩阵；
+    一批行动的影响一次矩阵乘法得出：行动国one-hot矩阵乘以self系数，加上目标国掩码矩阵乘以target系数
+    """
+
+    def __init__(self, rules: List[Dict], indicators: Sequence[str] = ("GDP", "失业率", "通胀率")):
+        self.indicators = tuple(indicators)
+        self._rules = []
+        self_rows, target_rows = [], []
+
+        def add_effect(effect: Dict) -> int:
+            self_rows.append([effect.get("self", {}).get(name, 0.0) for name in self.indicators])
+            target_rows.append([effect.get("target", {}).get(name, 0.0) for name in self.indicators])
+            return len(self_rows) - 1
+
+        for rule in rules:
+            variants = [(tuple(variant["keywords"]), add_effect(variant)) for variant in rule.get("variants", [])]
+            self._rules.append((rule["action"], tuple(rule.get("aliases", ())), variants, add_effect(rule)))
+        self._self = np.array(self_rows, dtype=float).reshape(-1, len(self.indicators))
+        self._target = np.array(target_rows, dtype=float).reshape(-1, len(self.indicators))
+
+    def classify(self, action: str, action_detail: str = "") -> Optional[int]:
+        """返回行动对应的效果行号，无法识别时返回None
+
+        行动名称与目录完全一致时直接命中，否则按顺序取第一条别名出现在名称中的规则；
+        变体关键词只在去掉目录名称后的行动名称中查找（如"退出联盟"、"取消报复性关税"），且不能带否定词。
+        行动详情是自由文本，常提及其他国家的行动或否定表述，不参与分类，只用于识别目标国家
+        """
+        action = (action or "").strip()
+        if not action:
+            return None
+        matched = next((rule for rule in self._rules if rule[0] == action), None)
+        if matched is None:
+            matched = next((rule for rule in self._rules if any(alias in action for alias in rule[1])), None)
+        if matched is None:
+            return None
+        name, _, variants, row = matched
+        text = action.replace(name, "")
+        for keywords, variant_row in variants:
+            if any(_mentions(text, keyword) for keyword in keywords):
+                return variant_row
+        return row
+
+    @staticmethod
+    def targets(actor: str, action_detail: str, countries: Sequence[str]) -> List[str]:
+        """从行动详情中提取目标国家，未提及其他国家时视为作用于所有其他国家"""
+        detail = (action_detail or "").lower()
+        others = [country for country in countries if country != actor]
+        mentioned = [country for country in others
+                     if any(alias in detail for alias in COUNTRY_ALIASES.get(country, (country,)))]
+        return mentioned or others
+
+    def deltas(self, actions: List[Tuple[str, str, str]],
+               countries: Sequence[str]) -> Tuple[np.ndarray, List[int]]:
+        """计算一批(行动国, 行动, 行动详情)对各国指标的变化
+
+        返回(国家数, 指标数)的变化矩阵与无法识别的行动下标，无法识别的行动不产生影响
+        """
+        index = {country: i for i, country in enumerate(countries)}
+        rows, unrecognized = [], []
+        actor_mask = np.zeros((len(actions), len(countries)))
+        target_mask = np.zeros((len(actions), len(countries)))
+        for i, (actor, action, action_detail) in enumerate(actions):
+            row = self.classify(action, action_detail)
+            if row is None:
+                unrecognized.append(i)
+                rows.append(0)
+                continue
+            rows.append(row)
+            if actor in index:
+                actor_mask[i, index[actor]] = 1.0
+            for target in self.targets(actor, action_detail, countries):
+                target_mask[i, index[target]] = 1.0
+        if not len(self._self):
+            return np.zeros((len(countries), len(self.indicators))), list(range(len(actions)))
+        rows = np.asarray(rows, dtype=int)
+        delta = actor_mask.T @ self._self[rows] + target_mask.T @ self._target[rows]
+        return delta, unrecognized
+
+    def apply(self, values: np.ndarray, countries: Sequence[str],
+              actions: List[Tuple[str, str, str]]) -> Tuple[np.ndarray, List[int]]:
+        """把一批行动的影响叠加到(国家数, 指标数)的指标数组上，返回新数组与无法识别的行动下标，不修改传入的数组"""
+        delta, unrecognized = self.deltas(actions, countries)
+        return np.round(values + delta, 2), unrecognized
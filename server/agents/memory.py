@@ -0,0 +1,159 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.output_parsers import StrOutputParser
+
+from server.utils import get_ChatOpenAI, estimate_tokens, truncate_tokens
+
+
+class MemorySummarizer:
+    """用LLM把移出窗口的旧记录增量合并进已有摘要"""
+
+    def __init__(self, model_name: str, max_tokens: int = 512):
+        self.max_tokens = max_tokens
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", """你是国际经贸博弈的记忆摘要助手。
+请把"已有摘要"与"新增记录"合并为一段新的摘要：保留各国采取的关键行动、立场变化与相互因果，
+删除重复与修饰性描述，只输出摘要正文，不超过{max_chars}字。"""),
+            ("human", "已有摘要：\n{summary}\n\n新增记录：\n{records}")
+        ])
+        self.model = get_ChatOpenAI(model_name, temperature=0.2, max_tokens=max_tokens, role="summary")
+        self.chain = self.prompt | self.model | StrOutputParser()
+
+    async def __call__(self, summary: str, records: List[str]) -> str:
+        return await self.chain.ainvoke({
+            "summary": summary or "无",
+            "records": "\n".join(records),
+            "max_chars": int(self.max_tokens / 0.6),
+        })
+
+
+class AgentMemory:
+    """agent的多轮对话记忆
+
+    历史以只追加的对话记录保存：每一轮的输入与agent自己的回复依次追加为消息，新的刺激放在最后，
+    使相邻两轮请求共享尽可能长的前缀，便于服务商复用前缀缓存。
+    其他agent的行动先放入收件箱，在该agent下一轮输入的开头一次性给出。
+    对话记录超过recent_tokens时，最早的若干轮整体移出并在后台合并为摘要；
+    每次压缩腾出一半窗口，两次压缩之间前缀保持不变，总长度始终受token_budget约束
+    """
+
+    def __init__(self, token_budget: int = 1500, recent_tokens: int = 1000,
+                 summarizer: Optional[Callable[[str, List[str]], Awaitable[str]]] = None):
+        self.token_budget = token_budget
+        self.recent_tokens = recent_tokens
+        self.summary_tokens = max(token_budget - recent_tokens, 0)
+        self.summarizer = summarizer
+        self.turns: List[Dict] = []
+        # 上一轮以来其他agent的行动，尚未告知该agent
+        self.inbox: List[str] = []
+        # 已移出窗口、尚未合并进摘要的记录
+        self.pending: List[str] = []
+        self.summary = ""
+        self._turns_size = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def format_entry(initiator: str, content: str, iteration: int) -> str:
+        return f"迭代{iteration}: {initiator}说: {content}"
+
+    def add(self, initiator: str, content: str, iteration: int) -> None:
+        """记录其他agent的行动，在下一轮输入中告知"""
+        self.inbox.append(truncate_tokens(self.format_entry(initiator, content, iteration), self.recent_tokens // 4))
+
+    def next_input(self, content: str) -> str:
+        """组合收件箱中的新进展与本轮刺激"""
+        if not self.inbox:
+            return content
+        return "上一轮以来的进展:\n" + "\n".join(self.inbox) + f"\n\n{content}"
+
+    def messages(self) -> List[BaseMessage]:
+        """历史对话消息，放在系统提示词之后、本轮输入之前"""
+        messages: List[BaseMessage] = []
+        earlier = ([f"摘要: {self.summary}"] if self.summary else []) + [
+            truncate_tokens(record, 60) for record in self.pending
+        ]
+        if earlier:
+            messages.append(HumanMessage(content="此前交互记录:\n" + "\n".join(earlier)))
+        for turn in self.turns:
+            messages.append(HumanMessage(content=turn["input"]))
+            messages.append(AIMessage(content=turn["output"]))
+        return messages
+
+    def commit(self, input: str, output: str, iteration: int, consumed: Optional[int] = None) -> None:
+        """追加本轮的输入与回复，并移出已写入input的收件箱记录
+
+        consumed为构建input时收件箱中的记录数，为空时清空收件箱；
+        迟到的回合提交时，其输入之后才收到的记录保留到下一轮
+        """
+        tokens = estimate_tokens(input) + estimate_tokens(output)
+        self.turns.append({"input": input, "output": output, "iteration": iteration, "tokens": tokens})
+        self._turns_size += tokens
+        if consumed is None:
+            self.inbox.clear()
+        else:
+            del self.inbox[:consumed]
+        if self._turns_size <= self.recent_tokens:
+            return
+
+        while len(self.turns) > 1 and self._turns_size > self.recent_tokens // 2:
+            turn = self.turns.pop(0)
+            self._turns_size -= turn["tokens"]
+            self.pending.append(f"迭代{turn['iteration']}: 收到: {turn['input']} 回应: {turn['output']}")
+        self._schedule_summary()
+
+    def to_dict(self) -> Dict:
+        """导出可序列化的记忆状态，用于检查点"""
+        return {
+            "turns": [dict(turn) for turn in self.turns],
+            "inbox": list(self.inbox),
+            "pending": list(self.pending),
+            "summary": self.summary,
+        }
+
+    def load(self, state: Dict) -> None:
+        """从检查点恢复记忆状态，尚未合并的记录在下次压缩时一并摘要"""
+        self.turns = [dict(turn) for turn in state.get("turns", [])]
+        self.inbox = list(state.get("inbox", []))
+        self.pending = list(state.get("pending", []))
+        self.summary = state.get("summary", "")
+        self._turns_size = sum(turn["tokens"] for turn in self.turns)
+
+    def close(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def _schedule_summary(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._merge_pending(None)
+            return
+        self._task = loop.create_task(self._summarize())
+
+    async def _summarize(self) -> None:
+        # 摘要在后台进行，不阻塞当前迭代；期间新移出的记录在下一轮循环中继续合并
+        while self.pending:
+            batch = self.pending[:]
+            summary = None
+            if self.summarizer is not None:
+                try:
+                    summary = await self.summarizer(self.summary, batch)
+                except Exception as e:
+                    print(f"警告: 记忆摘要失败，使用截断摘要: {e}")
+            self._merge_pending(summary, len(batch))
+
+    def _merge_pending(self, summary: Optional[str], count: Optional[int] = None) -> None:
+        batch = self.pending[:count] if count is not None else self.pending[:]
+        if not summary:
+            # 无摘要模型时退化为截断拼接，超出预算时丢弃最早的部分
+            parts = ([self.summary] if self.summary else []) + [truncate_tokens(record, 40) for record in batch]
+            while len(parts) > 1 and estimate_tokens("；".join(parts)) > self.summary_tokens:
+                parts.pop(0)
+            summary = "；".join(parts)
+        self.summary = truncate_tokens(summary.strip(), self.summary_tokens)
+        del self.pending[:len(batch)]
@@ -0,0 +1,107 @@
+import json
+import math
+import re
+from typing import Dict, Optional, Tuple
+
+import json_repair
+
+
+def parse_score(value) -> Optional[int]:
+    """将模型返回的score转换为整数，无法识别时返回None"""
+    try:
+        number = float(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+    return int(number) if math.isfinite(number) else None
+
+
+class AgentResponse:
+    """agent的一次响应，在解析时校验一次，之后直接读取属性，不再重复解析score"""
+
+    __slots__ = ("score", "action", "action_detail", "usage", "cancelled", "timed_out", "parse_path")
+
+    def __init__(self, score: int = 0, action: str = "", action_detail: str = "",
+                 usage: Optional[Dict[str, int]] = None, cancelled: bool = False,
+                 timed_out: bool = False, parse_path: str = "fast"):
+        self.score = score
+        self.action = action
+        self.action_detail = action_detail
+        self.usage = usage
+        self.cancelled = cancelled
+        self.timed_out = timed_out
+        # 解析路径：fast / repair / retry / partial（被取消或超时） / failed
+        self.parse_path = parse_path
+
+    @classmethod
+    def from_dict(cls, data: Dict, **kwargs) -> "AgentResponse":
+        """由已解析的字段构造，score限制在0-100，缺失时为0"""
+        score = parse_score(data.get("score"))
+        return cls(
+            score=min(max(score, 0), 100) if score is not None else 0,
+            action=str(data.get("action") or ""),
+            action_detail=str(data.get("action_detail") or ""),
+            **kwargs
+        )
+
+    def to_dict(self) -> Dict:
+        """写入记忆与事件的字段，竞价响应没有action_detail"""
+        data = {"score": self.score, "action": self.action}
+        if self.action_detail:
+            data["action_detail"] = self.action_detail
+        return data
+
+    def __repr__(self) -> str:
+        return f"AgentResponse(score={self.score}, action={self.action!r}, parse_path={self.parse_path!r})"
+
+
+_FENCE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.S)
+
+
+class ResponseParser:
+    """解析agent输出的JSON
+
+    先去掉代码块标记直接json.loads，失败再用json_repair修复；
+    返回(字段, 解析路径)；score可解析且action非空即为有效，action_detail可以为空（如观望）；
+    两者都得不到有效对象时字段为None，由调用方发起纠正重试
+    """
+
+    def __init__(self):
+        self.counters = {
+            "fast": 0,
+            "repair": 0,
+            "retry": 0,
+            "retry_success": 0,
+            "failed": 0,
+        }
+
+    @staticmethod
+    def _valid(data) -> bool:
+        return isinstance(data, dict) and parse_score(data.get("score")) is not None \
+            and bool(str(data.get("action") or "").strip())
+
+    def parse(self, text: str) -> Tuple[Optional[Dict], Optional[str]]:
+        text = text.strip()
+        match = _FENCE.match(text)
+        try:
+            data = json.loads(match.group(1) if match else text)
+        except ValueError:
+            data = None
+        if self._valid(data):
+            self.counters["fast"] += 1
+            return data, "fast"
+
+        try:
+            data = json_repair.loads(text)
+        except Exception:
+            data = None
+        if self._valid(data):
+            self.counters["repair"] += 1
+            return data, "repair"
+        return None, None
+
+    def stats(self) -> Dict:
+        return dict(self.counters)
+
+
+# 所有agent共用的解析器，counters统计各解析路径的次数
+response_parser = ResponseParser()
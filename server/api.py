@@ -1,15 +1,37 @@
 import uvicorn
+from contextlib import asynccontextmanager
 
-from server.start import start, fake_start
+from server.start import (start, fake_start, resume, list_runs, get_run, query_events, run_store, job_manager,
+                          create_simulation, get_simulation, cancel_simulation, simulation_events, shared_run_stats)
+from server.agents.response import response_parser
+from server.utils import model_registry
+from server.lifecycle import drain_state, health, register_stats, stats
+from configs import API_SERVER
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # 后台模拟与连接无关，需在关闭连接池之前单独等待；与uvicorn等待连接共用同一个排空期限，
+    # 总时长不超过启动参数--drain-timeout
+    await job_manager.drain(drain_state.remaining(app.state.drain_timeout))
+    # 关闭所有模型共用的HTTP连接池
+    await model_registry.aclose()
+    # 写入尚在队列中的运行记录
+    if run_store is not None:
+        run_store.close()
+
+
 def create_app():
     app = FastAPI(
         title="API Server",
+        lifespan=lifespan,
     )
+    # 排空超时，startup.py按启动参数覆盖
+    app.state.drain_timeout = API_SERVER["drain_timeout"]
     app.add_middleware(
         CORSMiddleware,
         allow_origins=['*'],
@@ -18,9 +40,25 @@ def create_app():
         allow_headers=["*"],
     )
 
-    # app.get("/start")(start)
+    app.get("/start")(start if API_SERVER["live_start"] else fake_start)
+    # 回放始终可用，开启live_start后前端仍可通过/replay演示
+    app.get("/replay")(fake_start)
+
+    app.get("/health")(health)
+    register_stats("models", model_registry.stats)
+    register_stats("response_parser", response_parser.stats)
+    register_stats("shared_runs", shared_run_stats)
+    app.get("/stats")(stats)
+
+    app.post("/simulations", status_code=202)(create_simulation)
+    app.get("/simulations/{simulation_id}")(get_simulation)
+    app.delete("/simulations/{simulation_id}")(cancel_simulation)
+    app.get("/simulations/{simulation_id}/events")(simulation_events)
 
-    app.get("/start")(fake_start)
+    app.get("/runs")(list_runs)
+    app.get("/runs/{run_id}")(get_run)
+    app.get("/runs/{run_id}/resume")(resume)
+    app.get("/events")(query_events)
 
     return app
 
@@ -0,0 +1,124 @@
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Optional, Set
+
+# 增量事件：可以合并或丢弃，最终内容会由随后的agent_response/economic_data完整给出
+DELTA_EVENTS = ("agent_delta", "context_delta")
+
+
+def _delta_key(event: Dict):
+    return event["type"], event["data"].get("agent"), event.get("iteration")
+
+
+class Subscriber:
+    """一个订阅者的有界事件队列
+
+    增量事件超出max_size后按policy处理：
+    "coalesce" 与队列中同一agent的增量合并为一条，文本不丢失；
+    "drop_oldest" 丢弃队列中最早的增量、保留最新的，慢观众直接跳到最新进度，在丢弃的位置放入一条lagged事件说明丢弃的数量。
+    其他事件数量有限，始终入队
+    """
+
+    def __init__(self, max_size: int = 256, policy: str = "coalesce"):
+        self.max_size = max_size
+        self.policy = policy
+        self.queue: Deque[Dict] = deque()
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+        self._wakeup = asyncio.Event()
+
+    def offer(self, event: Dict) -> None:
+        if event["type"] in DELTA_EVENTS and len(self.queue) >= self.max_size:
+            if self.policy == "coalesce":
+                key = _delta_key(event)
+                for queued in reversed(self.queue):
+                    if queued["type"] in DELTA_EVENTS and _delta_key(queued) == key:
+                        queued["data"] = {**queued["data"], "delta": queued["data"]["delta"] + event["data"]["delta"]}
+                        self.coalesced += 1
+                        return
+                    if queued["type"] not in DELTA_EVENTS:
+                        # 不跨越其他事件合并，保证事件顺序
+                        break
+            else:
+                self._drop_oldest_delta()
+        self.queue.append(event)
+        self._wakeup.set()
+
+    def _drop_oldest_delta(self) -> None:
+        for i, queued in enumerate(self.queue):
+            if queued["type"] not in DELTA_EVENTS:
+                continue
+            del self.queue[i]
+            self.dropped += 1
+            # 相邻的lagged事件合并计数
+            if i > 0 and self.queue[i - 1]["type"] == "lagged":
+                self.queue[i - 1]["data"]["dropped"] += 1
+            elif i < len(self.queue) and self.queue[i]["type"] == "lagged":
+                self.queue[i]["data"]["dropped"] += 1
+            else:
+                self.queue.insert(i, {"type": "lagged", "data": {"dropped": 1}, "iteration": queued.get("iteration", 0)})
+            return
+
+    def close(self) -> None:
+        self.closed = True
+        self._wakeup.set()
+
+    async def get(self) -> Optional[Dict]:
+        """取出下一条事件，广播结束且队列取空后返回None"""
+        while not self.queue:
+            if self.closed:
+                return None
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        return self.queue.popleft()
+
+
+class Broadcast:
+    """一次运行的事件广播：事件只产生一次，分发给任意数量的订阅者
+
+    发布不会等待任何订阅者；新加入的订阅者先收到此前的全部非增量事件，再接收实时事件
+    """
+
+    def __init__(self, max_size: int = 256, policy: str = "coalesce"):
+        self.max_size = max_size
+        self.policy = policy
+        self.subscribers: Set[Subscriber] = set()
+        self.history = []
+        self.finished = False
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.max_size, self.policy)
+        for event in self.history:
+            subscriber.offer(event)
+        if self.finished:
+            subscriber.close()
+        else:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers.discard(subscriber)
+        subscriber.close()
+
+    def publish(self, event: Dict) -> None:
+        if event["type"] not in DELTA_EVENTS:
+            self.history.append(event)
+        for subscriber in self.subscribers:
+            # 合并会修改队列中的事件，每个订阅者持有自己的副本
+            subscriber.offer(dict(event))
+
+    def close(self) -> None:
+        self.finished = True
+        for subscriber in self.subscribers:
+            subscriber.close()
+        self.subscribers.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "events": len(self.history),
+            "max_queue": max((len(subscriber.queue) for subscriber in self.subscribers), default=0),
+            "dropped": sum(subscriber.dropped for subscriber in self.subscribers),
+            "coalesced": sum(subscriber.coalesced for subscriber in self.subscribers),
+        }
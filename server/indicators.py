@@ -0,0 +1,188 @@
+import math
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from configs import INDICATOR_SCHEMAS
+
+# 指标schema注册表：schema名 -> 指标名（按存储顺序）
+_schemas: Dict[str, Tuple[str, ...]] = {}
+
+
+def register_schema(name: str, indicators: Sequence[str]) -> Tuple[str, ...]:
+    indicators = tuple(indicators)
+    if len(set(indicators)) != len(indicators):
+        raise ValueError(f"Schema {name} has duplicate indicators")
+    _schemas[name] = indicators
+    return indicators
+
+
+def get_schema(name: str) -> Tuple[str, ...]:
+    if name not in _schemas:
+        raise KeyError(f"Indicator schema {name} not registered")
+    return _schemas[name]
+
+
+def detect_schema(context: Dict) -> Tuple[str, Tuple[str, ...]]:
+    """按上下文中的指标名匹配已注册的schema，没有匹配时以首个国家的指标顺序作为临时schema"""
+    names = set()
+    for data in context.values():
+        names.update(data)
+    for name, indicators in _schemas.items():
+        if names == set(indicators):
+            return name, indicators
+    first = next(iter(context.values()), {})
+    return "custom", tuple(first) + tuple(sorted(names - set(first)))
+
+
+for _name, _indicators in INDICATOR_SCHEMAS.items():
+    register_schema(_name, _indicators)
+
+
+def _number(value) -> float:
+    """把指标值转换为有限的浮点数，布尔值、空值、非数字或非有限值抛出ValueError"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"Invalid indicator value: {value!r}")
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"Invalid indicator value: {value!r}")
+    return number
+
+
+class IndicatorSnapshot(Mapping):
+    """某一时刻各国指标的只读视图，按国家取值时返回新的dict，不会改动底层数组；没有数据（NaN）的指标不出现在结果中"""
+
+    __slots__ = ("countries", "indicators", "values", "_index")
+
+    def __init__(self, countries: Tuple[str, ...], indicators: Tuple[str, ...], values: np.ndarray):
+        self.countries = countries
+        self.indicators = indicators
+        self.values = values
+        self._index = {country: i for i, country in enumerate(countries)}
+
+    def __getitem__(self, country: str) -> Dict[str, float]:
+        return {name: value for name, value in zip(self.indicators, self.values[self._index[country]].tolist())
+                if math.isfinite(value)}
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.countries)
+
+    def __len__(self) -> int:
+        return len(self.countries)
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        return {country: self[country] for country in self.countries}
+
+    def __repr__(self) -> str:
+        return f"IndicatorSnapshot({self.to_dict()})"
+
+
+class IndicatorState:
+    """各国经济指标及其逐轮历史
+
+    历史存于(国家, 指标, 容量)数组，容量不足时翻倍扩展；每轮结束commit一次，
+    已提交的轮次只读，快照是数组切片而非拷贝，任意一轮的查询都是O(1)。
+    当前值在两次commit之间可多次更新，每次更新替换为新的只读数组，之前取得的快照保持不变
+    """
+
+    def __init__(self, countries: Sequence[str], indicators: Sequence[str], values: np.ndarray,
+                 schema: str = "custom", capacity: int = 8):
+        self.countries = tuple(countries)
+        self.indicators = tuple(indicators)
+        self.schema = schema
+        self._current = self._freeze(np.array(values, dtype=float).reshape(len(self.countries), len(self.indicators)))
+        self._history = np.empty((len(self.countries), len(self.indicators), max(capacity, 1)))
+        self._rounds = 0
+
+    @classmethod
+    def from_context(cls, context: Dict, schema: Optional[str] = None, capacity: int = 8) -> "IndicatorState":
+        """从{国家: {指标: 值}}构建，schema为空时按指标名自动匹配，缺失的指标记为NaN"""
+        if schema is None:
+            schema, indicators = detect_schema(context)
+        else:
+            indicators = get_schema(schema)
+        values = [[context[country].get(name, np.nan) for name in indicators] for country in context]
+        return cls(list(context), indicators, values, schema=schema, capacity=capacity)
+
+    @staticmethod
+    def _freeze(values: np.ndarray) -> np.ndarray:
+        values.flags.writeable = False
+        return values
+
+    @property
+    def values(self) -> np.ndarray:
+        """当前值，(国家, 指标)的只读数组"""
+        return self._current
+
+    def current(self) -> IndicatorSnapshot:
+        return IndicatorSnapshot(self.countries, self.indicators, self._current)
+
+    def update(self, values) -> None:
+        """以新的(国家, 指标)数组或{国家: {指标: 值}}替换当前值，dict中缺失的国家与指标保持不变
+
+        出现空值、非数字或非有限值时抛出ValueError，当前值保持不变
+        """
+        if isinstance(values, Mapping):
+            updated = self._current.copy()
+            column = {name: j for j, name in enumerate(self.indicators)}
+            for i, country in enumerate(self.countries):
+                data = values.get(country, {})
+                if not isinstance(data, Mapping):
+                    raise ValueError(f"Invalid indicators for {country}: {data!r}")
+                for name, value in data.items():
+                    if name in column:
+                        updated[i, column[name]] = _number(value)
+            values = updated
+        else:
+            values = np.array(values, dtype=float)
+            if values.shape != self._current.shape:
+                raise ValueError(f"Expected shape {self._current.shape}, got {values.shape}")
+            # 原本有数据的指标不能变为NaN或无穷
+            if (np.isfinite(self._current) & ~np.isfinite(values)).any():
+                raise ValueError("Indicator values must be finite")
+        self._current = self._freeze(values)
+
+    def commit(self) -> IndicatorSnapshot:
+        """把当前值记为新的一轮并返回该轮快照"""
+        if self._rounds == self._history.shape[2]:
+            grown = np.empty(self._history.shape[:2] + (self._rounds * 2,))
+            grown[:, :, :self._rounds] = self._history[:, :, :self._rounds]
+            self._history = grown
+        self._history[:, :, self._rounds] = self._current
+        self._rounds += 1
+        return self.round(self._rounds - 1)
+
+    def round(self, index: int) -> IndicatorSnapshot:
+        """第index轮结束时的快照，支持负数下标"""
+        if index < 0:
+            index += self._rounds
+        if not 0 <= index < self._rounds:
+            raise IndexError(f"Round {index} not recorded")
+        view = self._history[:, :, index]
+        view.flags.writeable = False
+        return IndicatorSnapshot(self.countries, self.indicators, view)
+
+    def __len__(self) -> int:
+        return self._rounds
+
+    def history(self) -> np.ndarray:
+        """已提交的全部轮次，(国家, 指标, 轮次)的只读视图"""
+        view = self._history[:, :, :self._rounds]
+        view.flags.writeable = False
+        return view
+
+    def history_dicts(self) -> List[Dict[str, Dict[str, float]]]:
+        return [self.round(i).to_dict() for i in range(self._rounds)]
+
+    def load_history(self, rounds: List[Dict]) -> None:
+        """恢复已提交的轮次（history_dicts的输出），当前值不变"""
+        self._history = np.empty((len(self.countries), len(self.indicators), max(len(rounds), 8)))
+        self._rounds = 0
+        current = self._current
+        for context in rounds:
+            self._current = current
+            self.update(context)
+            self._history[:, :, self._rounds] = self._current
+            self._rounds += 1
+        self._current = current
@@ -0,0 +1,183 @@
+import asyncio
+import time
+from collections import deque
+from typing import AsyncIterable, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from server.session import SimulationSession
+
+
+class JobPoolSaturated(Exception):
+    """工作池与等待队列已满"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Simulation pool is saturated, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class SimulationJob:
+    """后台运行的一次模拟
+
+    事件按顺序编号（从0开始，与运行记录中的seq一致），最近buffer_size条保存在内存中，
+    订阅者可以从任意编号之后继续读取
+    """
+
+    def __init__(self, session: SimulationSession, buffer_size: int = 2000):
+        self.id = session.run_id
+        self.session = session
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.buffer: Deque[Tuple[int, Dict]] = deque(maxlen=buffer_size)
+        self.next_id = 0
+        self.task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def publish(self, event: Dict) -> None:
+        self.buffer.append((self.next_id, event))
+        self.next_id += 1
+        self._notify()
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self._notify()
+
+    def _notify(self) -> None:
+        # 唤醒当前所有等待者，之后的等待使用新的Event
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    async def subscribe(self, after: Optional[int] = None, heartbeat: Optional[float] = None,
+                        history: Optional[Callable[[int, int], Awaitable[List[Dict]]]] = None
+                        ) -> AsyncIterable[Optional[Tuple[int, Dict]]]:
+        """依次产出编号大于after的(编号, 事件)，运行结束且事件读完后返回
+
+        超过heartbeat秒没有新事件时产出None，供调用方发送心跳；
+        已移出内存的旧事件通过history(起始编号, 结束编号)补齐
+        """
+        next_id = after + 1 if after is not None else 0
+        while True:
+            wakeup = self._wakeup
+            first_id = self.buffer[0][0] if self.buffer else self.next_id
+            if next_id < first_id and history is not None:
+                for event in await history(next_id, first_id):
+                    yield next_id, event
+                    next_id += 1
+            next_id = max(next_id, first_id)
+            for event_id, event in list(self.buffer):
+                if event_id >= next_id:
+                    yield event_id, event
+                    next_id = event_id + 1
+            if self.finished and next_id >= self.next_id:
+                return
+            if next_id < self.next_id:
+                continue
+            try:
+                await asyncio.wait_for(wakeup.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+    def info(self) -> Dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "iteration": self.session.iteration,
+            "events": self.next_id,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """有界的模拟工作池
+
+    最多max_workers个模拟同时运行，另有max_queued个排队；再有提交时拒绝并给出建议的重试时间。
+    模拟与客户端连接解耦，断开后重新订阅即可继续接收事件；结束的任务保留retention秒
+    """
+
+    def __init__(self, max_workers: int = 4, max_queued: int = 8, buffer_size: int = 2000,
+                 retention: float = 600, default_retry_after: int = 30):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.buffer_size = buffer_size
+        self.retention = retention
+        self.default_retry_after = default_retry_after
+        self.jobs: Dict[str, SimulationJob] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        # 最近完成的运行耗时，用于估算Retry-After
+        self._durations: Deque[float] = deque(maxlen=20)
+
+    def active(self) -> List[SimulationJob]:
+        return [job for job in self.jobs.values() if not job.finished]
+
+    def retry_after(self) -> int:
+        if not self._durations:
+            return self.default_retry_after
+        queued = sum(1 for job in self.active() if job.status == "queued")
+        average = sum(self._durations) / len(self._durations)
+        return max(1, int(average * (queued + 1) / self.max_workers))
+
+    def submit(self, session: SimulationSession,
+               run: Callable[[SimulationSession], AsyncIterable[Dict]]) -> SimulationJob:
+        """提交一次模拟，run为产出运行事件的异步迭代器工厂"""
+        self._evict()
+        if len(self.active()) >= self.max_workers + self.max_queued:
+            raise JobPoolSaturated(self.retry_after())
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        job = SimulationJob(session, self.buffer_size)
+        job.task = asyncio.create_task(self._run(job, run))
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[SimulationJob]:
+        self._evict()
+        return self.jobs.get(job_id)
+
+    async def _run(self, job: SimulationJob, run: Callable[[SimulationSession], AsyncIterable[Dict]]) -> None:
+        async with self._slots:
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                async for event in run(job.session):
+                    job.publish(event)
+            except Exception as e:
+                print(f"模拟 {job.id} 运行出错: {e}")
+                job.finish("failed", str(e))
+                return
+            self._durations.append(time.time() - job.started_at)
+            job.finish("aborted" if job.session.aborted else "completed")
+
+    def cancel(self, job_id: str, reason: str = "cancelled") -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.session.abort(reason)
+        return True
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """等待运行中与排队的模拟结束，超时后中止剩余的模拟（可之后从检查点恢复）"""
+        tasks = [job.task for job in self.active() if job.task is not None]
+        if not tasks:
+            return
+        print(f"等待 {len(tasks)} 个后台模拟结束...")
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            for job in self.active():
+                job.session.abort("server_shutdown")
+            await asyncio.wait(pending)
+
+    def _evict(self) -> None:
+        now = time.time()
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.finished and now - job.finished_at > self.retention]:
+            del self.jobs[job_id]
@@ -0,0 +1,59 @@
+import time
+from typing import Callable, Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+
+class DrainState:
+    """服务进程的排空状态
+
+    收到退出信号后进入排空：不再接受新的模拟，正在运行的模拟继续运行到结束或排空超时
+    """
+
+    def __init__(self):
+        self.draining = False
+        self.active_runs = 0
+        # 进入排空的时刻，排空超时从此时开始计算
+        self.started_at: Optional[float] = None
+
+    def begin(self) -> None:
+        if not self.draining:
+            print(f"开始排空：拒绝新的模拟请求，等待 {self.active_runs} 个运行中的模拟结束")
+            self.started_at = time.monotonic()
+        self.draining = True
+
+    def remaining(self, timeout: float) -> float:
+        """从进入排空起算，timeout秒的排空时间还剩多少"""
+        if self.started_at is None:
+            return timeout
+        return max(timeout - (time.monotonic() - self.started_at), 0.0)
+
+    def check_accepting(self) -> None:
+        """排空期间拒绝新的模拟，客户端可稍后重试（届时由新进程处理）"""
+        if self.draining:
+            raise HTTPException(status_code=503, detail="Server is draining", headers={"Retry-After": "5"})
+
+
+drain_state = DrainState()
+
+
+async def health() -> JSONResponse:
+    """健康检查，排空期间返回503，便于部署脚本与负载均衡摘除该进程"""
+    return JSONResponse(
+        {"status": "draining" if drain_state.draining else "ok", "active_runs": drain_state.active_runs},
+        status_code=503 if drain_state.draining else 200,
+    )
+
+
+# /stats的数据来源，名称 -> 返回统计dict的函数，由api.py在创建应用时注册
+_stats_sources: Dict[str, Callable[[], Dict]] = {}
+
+
+def register_stats(name: str, source: Callable[[], Dict]) -> None:
+    _stats_sources[name] = source
+
+
+async def stats() -> JSONResponse:
+    """只读的运行统计：模型缓存与合并、连接池与后端、对冲、响应解析、共享运行的广播等"""
+    return JSONResponse({name: source() for name, source in _stats_sources.items()})
@@ -0,0 +1,7 @@
+from server.llm.cache import LLMCache, make_cache_key
+from server.llm.ratelimit import EndpointRateLimiter
+from server.llm.hedging import Hedger, with_deadline
+from server.llm.router import Backend, BackendState, pick_backend
+from server.llm.singleflight import SingleFlight
+from server.llm.chat import SimChatModel
+from server.llm.registry import ModelRegistry
@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_core.messages import BaseMessage
+
+
+def make_cache_key(model_name: str, params: Dict, messages: List[BaseMessage]) -> str:
+    """根据模型名、调用参数与渲染后的消息生成内容寻址的缓存键"""
+    payload = {
+        "model": model_name,
+        "params": params,
+        "messages": [[message.type, message.content] for message in messages],
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """两级LLM响应缓存：内存LRU + 本地磁盘，均按TTL过期
+
+    缓存值为可JSON序列化的字典，磁盘读写在线程池中执行，不阻塞事件循环
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 7 * 24 * 3600,
+                 disk_dir: Optional[str] = None, disk_max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._disk_writes = 0
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    def stats(self) -> Dict:
+        total = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        return {
+            **self.counters,
+            "memory_entries": len(self._memory),
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+    async def aget(self, key: str) -> Optional[Dict]:
+        value = self._memory_get(key)
+        if value is not None:
+            self.counters["memory_hits"] += 1
+            return value
+        if self.disk_dir:
+            entry = await asyncio.to_thread(self._disk_get, key)
+            if entry is not None:
+                self.counters["disk_hits"] += 1
+                self._memory_set(key, entry["value"], entry["created"])
+                return entry["value"]
+        self.counters["misses"] += 1
+        return None
+
+    async def aset(self, key: str, value: Dict) -> None:
+        created = time.time()
+        self._memory_set(key, value, created)
+        self.counters["stores"] += 1
+        if self.disk_dir:
+            await asyncio.to_thread(self._disk_set, key, value, created)
+
+    def clear(self) -> None:
+        self._memory.clear()
+
+    def _memory_get(self, key: str) -> Optional[Dict]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        created, value = entry
+        if time.time() - created > self.ttl:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: Dict, created: float) -> None:
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_get(self, key: str) -> Optional[Dict]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get("created", 0) > self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def _disk_set(self, key: str, value: Dict, created: float) -> None:
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，避免并发读到半个文件
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created": created, "value": value}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._disk_writes += 1
+        if self._disk_writes % 64 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """清理过期文件，并在超过容量时按修改时间淘汰最旧的条目"""
+        files = []
+        now = time.time()
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                if now - mtime > self.ttl:
+                    os.remove(path)
+                    self.counters["evictions"] += 1
+                else:
+                    files.append((mtime, path))
+        overflow = len(files) - self.disk_max_entries
+        if overflow > 0:
+            for _, path in sorted(files)[:overflow]:
+                try:
+                    os.remove(path)
+                    self.counters["evictions"] += 1
+                except OSError:
+                    pass
@@ -0,0 +1,204 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict
+
+from server.llm.cache import LLMCache, make_cache_key
+from server.llm.hedging import Hedger, with_deadline
+from server.llm.router import Backend, pick_backend
+from server.llm.singleflight import SingleFlight
+from server.llm.tokens import estimate_tokens
+
+
+class SimChatModel(BaseChatModel):
+    """包装底层ChatOpenAI的调用层，负责响应缓存、在途请求合并、限流、多后端路由等与具体模型无关的逻辑
+
+    同时实现ainvoke与astream两条路径，链式调用可以无差别地替换ChatOpenAI。
+    每次调用从backends中选择负载最低的后端，失败时换下一个后端重试；
+    deadline为单次调用的截止时间（秒），超时抛出asyncio.TimeoutError；hedger负责对冲慢请求
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    backends: List[Backend]
+    model_name: str
+    temperature: float
+    max_tokens: int
+    response_cache: Optional[LLMCache] = None
+    flights: Optional[SingleFlight] = None
+    deadline: Optional[float] = None
+    hedger: Optional[Hedger] = None
+    # 关闭langchain自带的全局缓存，由response_cache接管
+    cache: Optional[bool] = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "sim-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {
+            "model_name": self.model_name,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+
+    def _cache_key(self, messages: List[BaseMessage], stop: Optional[List[str]]) -> str:
+        return make_cache_key(self.model_name, {**self._identifying_params, "stop": stop}, messages)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        # 同步接口不经过缓存，直接调用底层模型
+        message = pick_backend(self.backends).model.invoke(messages, stop=stop, **kwargs)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key = self._cache_key(messages, stop)
+        if self.response_cache is not None:
+            cached = await self.response_cache.aget(key)
+            if cached is not None:
+                message = AIMessage(content=cached["content"], response_metadata={"cache_hit": True})
+                return ChatResult(generations=[ChatGeneration(message=message)])
+
+        if self.flights is not None:
+            # 截止时间按调用方计算，超时的调用方离开后合并请求由其余调用方继续等待
+            message = await self._within_deadline(self.flights.do(key, lambda: self._call(key, messages, stop, **kwargs)))
+            # 合并后的结果被多个调用方共享，返回副本避免互相修改元数据
+            message = message.model_copy()
+        else:
+            message = await self._within_deadline(self._call(key, messages, stop, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        key = self._cache_key(messages, stop)
+        if self.response_cache is not None:
+            cached = await self.response_cache.aget(key)
+            if cached is not None:
+                yield ChatGenerationChunk(message=AIMessageChunk(
+                    content=cached["content"], response_metadata={"cache_hit": True}
+                ))
+                return
+
+        if self.flights is not None:
+            source = self.flights.stream(key, lambda: self._open_stream(key, messages, stop, **kwargs))
+        else:
+            source = self._open_stream(key, messages, stop, **kwargs)
+        if self.deadline is not None:
+            source = with_deadline(source, self.deadline)
+        try:
+            async for chunk in source:
+                yield ChatGenerationChunk(message=chunk.model_copy() if self.flights is not None else chunk)
+        except asyncio.TimeoutError:
+            self._deadline_exceeded()
+            raise
+
+    def _call(self, key: str, messages, stop, **kwargs):
+        if self.hedger is None:
+            return self._invoke(key, messages, stop, **kwargs)
+        return self.hedger.invoke(lambda: self._invoke(key, messages, stop, **kwargs))
+
+    def _open_stream(self, key: str, messages, stop, **kwargs) -> AsyncIterator[AIMessageChunk]:
+        if self.hedger is None:
+            return self._stream(key, messages, stop, **kwargs)
+        return self.hedger.stream(lambda: self._stream(key, messages, stop, **kwargs))
+
+    async def _within_deadline(self, call):
+        if self.deadline is None:
+            return await call
+        try:
+            return await asyncio.wait_for(call, self.deadline)
+        except asyncio.TimeoutError:
+            self._deadline_exceeded()
+            raise
+
+    def _deadline_exceeded(self) -> None:
+        print(f"警告: {self.model_name} 调用超过截止时间 {self.deadline} 秒")
+        if self.hedger is not None:
+            self.hedger.counters["deadline_exceeded"] += 1
+
+    def _reserve_tokens(self, messages: List[BaseMessage]) -> int:
+        """调用前预占的token数：估算的输入token加上输出上限"""
+        return sum(estimate_tokens(str(message.content)) for message in messages) + self.max_tokens
+
+    @staticmethod
+    def _used_tokens(message, reserved_input: int) -> int:
+        usage = getattr(message, "usage_metadata", None) or {}
+        if usage.get("total_tokens"):
+            return usage["total_tokens"]
+        return reserved_input + estimate_tokens(str(message.content))
+
+    async def _invoke(self, key: str, messages, stop, **kwargs) -> AIMessage:
+        tried: List[Backend] = []
+        while True:
+            backend = pick_backend(self.backends, exclude=tried)
+            tried.append(backend)
+            state, limiter = backend.state, backend.state.limiter
+            reserved = 0
+            if limiter is not None:
+                reserved = self._reserve_tokens(messages)
+                await limiter.acquire(reserved)
+            state.begin()
+            started = time.monotonic()
+            message = None
+            try:
+                message = await backend.model.ainvoke(messages, stop=stop, **kwargs)
+            except Exception as e:
+                state.end(time.monotonic() - started, ok=False)
+                if len(tried) >= len(self.backends):
+                    raise
+                print(f"警告: 后端 {state.name} 调用失败，切换后端重试: {e}")
+                continue
+            except BaseException:
+                # 被调用方取消（对冲落败、超时、中止），不计入后端健康统计
+                state.end(None, ok=None)
+                raise
+            finally:
+                # 失败或被取消的调用没有用量，预占的配额全部归还
+                if limiter is not None:
+                    used = self._used_tokens(message, reserved - self.max_tokens) if message is not None else 0
+                    limiter.settle(reserved, used)
+            state.end(time.monotonic() - started, ok=True)
+            break
+        if self.response_cache is not None:
+            await self.response_cache.aset(key, {"content": message.content})
+        return message
+
+    async def _stream(self, key: str, messages, stop, **kwargs) -> AsyncIterator[AIMessageChunk]:
+        tried: List[Backend] = []
+        while True:
+            backend = pick_backend(self.backends, exclude=tried)
+            tried.append(backend)
+            state, limiter = backend.state, backend.state.limiter
+            reserved = 0
+            if limiter is not None:
+                reserved = self._reserve_tokens(messages)
+                await limiter.acquire(reserved)
+            state.begin()
+            started = time.monotonic()
+            merged = None
+            ok = None
+            try:
+                async for chunk in backend.model.astream(messages, stop=stop, **kwargs):
+                    merged = chunk if merged is None else merged + chunk
+                    yield chunk
+                ok = True
+            except Exception as e:
+                ok = False
+                # 已经输出过内容的流无法透明地换后端，只在首个chunk之前失败时重试
+                if merged is not None or len(tried) >= len(self.backends):
+                    raise
+                print(f"警告: 后端 {state.name} 调用失败，切换后端重试: {e}")
+            finally:
+                state.end(time.monotonic() - started if ok is not None else None, ok=ok)
+                # 被提前取消的流也按已生成的内容结算配额
+                if limiter is not None:
+                    used = self._used_tokens(merged, reserved - self.max_tokens) if merged is not None else reserved - self.max_tokens
+                    limiter.settle(reserved, used)
+            if ok:
+                break
+        # 只缓存完整生成的结果，被提前取消的流不会走到这里
+        if self.response_cache is not None:
+            await self.response_cache.aset(key, {"content": merged.content if merged is not None else ""})
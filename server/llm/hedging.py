@@ -0,0 +1,152 @@
+import asyncio
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+
+class Hedger:
+    """对冲请求：主请求超过近期延迟的分位数仍未返回时，再发起一个相同的请求，取先返回者
+
+    普通调用统计完整响应延迟，流式调用统计首个chunk的延迟；
+    未开启或样本不足min_samples时不对冲，对冲延迟限制在[min_delay, max_delay]之间
+    """
+
+    def __init__(self, enabled: bool = True, percentile: float = 0.95, min_samples: int = 20, min_delay: float = 1.0,
+                 max_delay: float = 30.0, window: int = 200):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._latencies = {"invoke": deque(maxlen=window), "stream": deque(maxlen=window)}
+        self.counters = {
+            "calls": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "deadline_exceeded": 0,
+        }
+
+    def observe(self, kind: str, latency: float) -> None:
+        self._latencies[kind].append(latency)
+
+    def delay(self, kind: str) -> Optional[float]:
+        """发起对冲前等待的秒数，样本不足时返回None"""
+        samples = self._latencies[kind]
+        if not self.enabled or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        value = ordered[min(int(len(ordered) * self.percentile), len(ordered) - 1)]
+        return min(max(value, self.min_delay), self.max_delay)
+
+    async def invoke(self, call: Callable[[], Awaitable]):
+        """执行call，超过对冲延迟时并行发起第二次call，返回先成功的结果并取消另一个"""
+        self.counters["calls"] += 1
+        delay = self.delay("invoke")
+        started = {asyncio.ensure_future(call()): time.monotonic()}
+        primary = next(iter(started))
+        pending = set(started)
+        error = None
+        try:
+            while pending:
+                timeout = None
+                if delay is not None and len(started) == 1:
+                    timeout = max(delay - (time.monotonic() - started[primary]), 0)
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.counters["hedged"] += 1
+                    hedge = asyncio.ensure_future(call())
+                    started[hedge] = time.monotonic()
+                    pending.add(hedge)
+                    continue
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    self.observe("invoke", time.monotonic() - started[task])
+                    if task is not primary:
+                        self.counters["hedge_wins"] += 1
+                    return task.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, open_stream: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """流式版本：比较首个chunk的到达时间，先出首个chunk的流胜出，另一个流被关闭"""
+        self.counters["calls"] += 1
+        delay = self.delay("stream")
+        streams = {}
+
+        def launch():
+            stream = open_stream()
+            streams[asyncio.ensure_future(stream.__anext__())] = (stream, time.monotonic())
+
+        launch()
+        primary = next(iter(streams))
+        winner, first, error = None, None, None
+        try:
+            while streams and winner is None:
+                timeout = None
+                if delay is not None and len(streams) == 1 and primary in streams:
+                    timeout = max(delay - (time.monotonic() - streams[primary][1]), 0)
+                done, _ = await asyncio.wait(streams, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.counters["hedged"] += 1
+                    launch()
+                    continue
+                for future in done:
+                    stream, launched = streams.pop(future)
+                    if isinstance(future.exception(), StopAsyncIteration):
+                        # 空流也视为完成
+                        winner = stream
+                    elif future.exception() is not None:
+                        error = future.exception()
+                        await stream.aclose()
+                        continue
+                    else:
+                        winner, first = stream, future.result()
+                    self.observe("stream", time.monotonic() - launched)
+                    if future is not primary:
+                        self.counters["hedge_wins"] += 1
+                    break
+        finally:
+            for future, (stream, _) in streams.items():
+                future.cancel()
+                await asyncio.gather(future, return_exceptions=True)
+                await stream.aclose()
+        if winner is None:
+            raise error
+        try:
+            if first is not None:
+                yield first
+                async for chunk in winner:
+                    yield chunk
+        finally:
+            await winner.aclose()
+
+    def stats(self) -> Dict:
+        calls = self.counters["calls"]
+        return {
+            **self.counters,
+            "hedge_rate": self.counters["hedged"] / calls if calls else 0.0,
+            "win_rate": self.counters["hedge_wins"] / self.counters["hedged"] if self.counters["hedged"] else 0.0,
+            "invoke_delay": self.delay("invoke"),
+            "stream_delay": self.delay("stream"),
+        }
+
+
+async def with_deadline(stream: AsyncIterator, deadline: float) -> AsyncIterator:
+    """为异步流设置整体截止时间，超时抛出asyncio.TimeoutError并关闭底层流"""
+    deadline_at = time.monotonic() + deadline
+    try:
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), remaining)
+            except StopAsyncIteration:
+                break
+            yield chunk
+    finally:
+        await stream.aclose()
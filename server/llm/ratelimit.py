@@ -0,0 +1,98 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+
+class _TokenBucket:
+    """容量为每分钟配额、匀速补充的令牌桶"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self.refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        self.refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class EndpointRateLimiter:
+    """单个模型端点的RPM/TPM限流器
+
+    请求与token各一个令牌桶，调用方按到达顺序排队（asyncio.Lock为先进先出），
+    调用前按估算的token数预占配额，结束后按实际用量多退少补
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self._requests = _TokenBucket(rpm) if rpm else None
+        self._tokens = _TokenBucket(tpm) if tpm else None
+        self._lock = asyncio.Lock()
+        self.queue_depth = 0
+        self.counters = {
+            "acquired": 0,
+            "throttled": 0,
+            "max_queue_depth": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0,
+        }
+
+    def stats(self) -> Dict:
+        acquired = self.counters["acquired"]
+        return {
+            **self.counters,
+            "queue_depth": self.queue_depth,
+            "avg_wait": self.counters["total_wait"] / acquired if acquired else 0.0,
+        }
+
+    async def acquire(self, tokens: int) -> float:
+        """等待配额并预占，返回排队等待的秒数"""
+        started = time.monotonic()
+        self.queue_depth += 1
+        self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], self.queue_depth)
+        try:
+            async with self._lock:
+                while True:
+                    delay = max(
+                        self._requests.wait_time(1) if self._requests else 0.0,
+                        self._tokens.wait_time(tokens) if self._tokens else 0.0,
+                    )
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                if self._requests:
+                    self._requests.take(1)
+                if self._tokens:
+                    self._tokens.take(tokens)
+        finally:
+            self.queue_depth -= 1
+
+        waited = time.monotonic() - started
+        self.counters["acquired"] += 1
+        self.counters["total_wait"] += waited
+        self.counters["max_wait"] = max(self.counters["max_wait"], waited)
+        if waited > 0.01:
+            self.counters["throttled"] += 1
+        return waited
+
+    def settle(self, reserved: int, used: int) -> None:
+        """按实际用量修正预占的token配额"""
+        if self._tokens is None:
+            return
+        if used < reserved:
+            self._tokens.give_back(reserved - used)
+        elif used > reserved:
+            self._tokens.take(used - reserved)
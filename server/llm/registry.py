@@ -0,0 +1,172 @@
+import json
+from typing import Any, Dict, List, Optional
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from server.llm.cache import LLMCache
+from server.llm.chat import SimChatModel
+from server.llm.hedging import Hedger
+from server.llm.ratelimit import EndpointRateLimiter
+from server.llm.router import Backend, BackendState
+from server.llm.singleflight import SingleFlight
+
+
+class ModelRegistry:
+    """按(模型, 参数)共享模型实例
+
+    所有实例复用同一组带连接池的HTTP客户端，扇出调用不再重复建立TCP/TLS连接，
+    并发会话下的连接总数受max_connections约束。
+    模型配置了多个backends时，每个实例为每个后端各建一个底层模型，由SimChatModel按负载路由。
+    role区分调用角色（agent、context等），同一角色共享截止时间与对冲统计
+    """
+
+    def __init__(self, models: Dict[str, Dict], http_config: Optional[Dict] = None,
+                 response_cache: Optional[LLMCache] = None, flights: Optional[SingleFlight] = None,
+                 routing_config: Optional[Dict] = None, deadlines: Optional[Dict[str, float]] = None,
+                 hedging_config: Optional[Dict] = None):
+        self.models = models
+        self.http_config = http_config or {}
+        self.routing_config = routing_config or {}
+        self.deadlines = deadlines or {}
+        self.hedging_config = hedging_config or {}
+        self.response_cache = response_cache
+        self.flights = flights
+        self._instances: Dict[str, SimChatModel] = {}
+        # 每个后端一个状态（含限流器），同一后端的所有实例共享配额与健康统计
+        self._backend_states: Dict[str, List[BackendState]] = {}
+        self._hedgers: Dict[str, Hedger] = {}
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+
+    def _client_options(self) -> Dict[str, Any]:
+        config = self.http_config
+        http2 = config.get("http2", False)
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                print("警告: 未安装h2，HTTP/2不可用，改用HTTP/1.1")
+                http2 = False
+        return {
+            "limits": httpx.Limits(
+                max_connections=config.get("max_connections", 100),
+                max_keepalive_connections=config.get("max_keepalive_connections", 20),
+                keepalive_expiry=config.get("keepalive_expiry", 30),
+            ),
+            "timeout": httpx.Timeout(config.get("timeout", 120), connect=config.get("connect_timeout", 10)),
+            "http2": http2,
+        }
+
+    @property
+    def http_client(self) -> httpx.Client:
+        if self._http_client is None:
+            self._http_client = httpx.Client(**self._client_options())
+        return self._http_client
+
+    @property
+    def http_async_client(self) -> httpx.AsyncClient:
+        if self._http_async_client is None:
+            self._http_async_client = httpx.AsyncClient(**self._client_options())
+        return self._http_async_client
+
+    def get(self, model_name: str, temperature: float = 0.6, max_tokens: int = 1024 * 8,
+            streaming: bool = False, verbose: bool = True, role: Optional[str] = None,
+            **kwargs: Any) -> SimChatModel:
+        """获取共享的模型实例，相同参数返回同一个对象"""
+        config = self.models.get(model_name, {})
+        if not config:
+            raise ValueError(f"Model {model_name} not found")
+
+        key = json.dumps([model_name, temperature, max_tokens, streaming, verbose, role, kwargs], sort_keys=True, default=str)
+        instance = self._instances.get(key)
+        if instance is not None:
+            return instance
+
+        # 流式调用也返回token用量，便于统计前缀缓存命中
+        kwargs.setdefault("stream_usage", True)
+        backends = []
+        for state, backend_config in zip(self.backend_states(model_name), self._backend_configs(config)):
+            model = ChatOpenAI(
+                streaming=streaming,
+                verbose=verbose,
+                openai_api_key=backend_config.get("api_key", ""),
+                openai_api_base=backend_config.get("api_base_url", ""),
+                model_name=config.get("model_name"),
+                temperature=temperature,
+                max_tokens=max_tokens,
+                http_client=self.http_client,
+                http_async_client=self.http_async_client,
+                **kwargs
+            )
+            backends.append(Backend(state, model))
+        instance = SimChatModel(
+            backends=backends,
+            model_name=config.get("model_name"),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            response_cache=self.response_cache,
+            flights=self.flights,
+            deadline=self.deadlines.get(role),
+            hedger=self.hedger(model_name, role),
+        )
+        self._instances[key] = instance
+        return instance
+
+    @staticmethod
+    def _backend_configs(config: Dict) -> List[Dict]:
+        """模型的后端列表，未配置backends时为单个后端；后端未指定的字段沿用模型配置"""
+        base = {key: config.get(key) for key in ("api_base_url", "api_key", "rpm", "tpm")}
+        return [{**base, **backend} for backend in config.get("backends") or [{}]]
+
+    def backend_states(self, model_name: str) -> List[BackendState]:
+        """获取模型各后端的共享状态，未配置rpm/tpm的后端不限流"""
+        if model_name not in self._backend_states:
+            states = []
+            for i, backend in enumerate(self._backend_configs(self.models.get(model_name, {}))):
+                rpm, tpm = backend.get("rpm"), backend.get("tpm")
+                states.append(BackendState(
+                    name=f"{model_name}#{i}",
+                    limiter=EndpointRateLimiter(rpm=rpm, tpm=tpm) if rpm or tpm else None,
+                    failure_threshold=self.routing_config.get("failure_threshold", 3),
+                    eject_seconds=self.routing_config.get("eject_seconds", 30),
+                ))
+            self._backend_states[model_name] = states
+        return self._backend_states[model_name]
+
+    def hedger(self, model_name: str, role: Optional[str] = None) -> Hedger:
+        """获取模型某一角色的对冲器，延迟分布按角色分别统计"""
+        name = f"{model_name}:{role or 'default'}"
+        if name not in self._hedgers:
+            config = self.hedging_config
+            self._hedgers[name] = Hedger(
+                enabled=config.get("enabled", False),
+                percentile=config.get("percentile", 0.95),
+                min_samples=config.get("min_samples", 20),
+                min_delay=config.get("min_delay", 1.0),
+                max_delay=config.get("max_delay", 30.0),
+                window=config.get("window", 200),
+            )
+        return self._hedgers[name]
+
+    def stats(self) -> Dict:
+        return {
+            "instances": len(self._instances),
+            "max_connections": self.http_config.get("max_connections", 100),
+            "http2": self.http_config.get("http2", False),
+            "backends": {
+                state.name: state.stats() for states in self._backend_states.values() for state in states
+            },
+            "hedging": {name: hedger.stats() for name, hedger in self._hedgers.items()},
+            "cache": self.response_cache.stats() if self.response_cache is not None else None,
+            "singleflight": self.flights.stats() if self.flights is not None else None,
+        }
+
+    async def aclose(self) -> None:
+        """关闭共享的HTTP连接池"""
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+            self._http_async_client = None
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
@@ -0,0 +1,87 @@
+import time
+from typing import Dict, Iterable, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from server.llm.ratelimit import EndpointRateLimiter
+
+
+class BackendState:
+    """一个后端端点（地址+密钥）的负载与健康状态，被该端点的所有模型实例共享
+
+    连续失败达到failure_threshold次后摘除eject_seconds秒，期满后重新参与路由
+    """
+
+    def __init__(self, name: str, limiter: Optional[EndpointRateLimiter] = None,
+                 failure_threshold: int = 3, eject_seconds: float = 30.0):
+        self.name = name
+        self.limiter = limiter
+        self.failure_threshold = failure_threshold
+        self.eject_seconds = eject_seconds
+        self.outstanding = 0
+        self.latency_ewma: Optional[float] = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.counters = {
+            "requests": 0,
+            "failures": 0,
+            "ejections": 0,
+        }
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def load_score(self) -> float:
+        """在途请求数按平均延迟加权，越小越优先"""
+        return (self.outstanding + 1) * (self.latency_ewma or 1.0)
+
+    def begin(self) -> None:
+        self.outstanding += 1
+        self.counters["requests"] += 1
+
+    def end(self, latency: Optional[float], ok: Optional[bool]) -> None:
+        """结束一次请求，ok为None表示请求被调用方取消，不计入健康统计"""
+        self.outstanding -= 1
+        if ok is None:
+            return
+        if ok:
+            self.consecutive_failures = 0
+            if latency is not None:
+                self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+            return
+        self.counters["failures"] += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self.ejected_until = time.monotonic() + self.eject_seconds
+            self.consecutive_failures = 0
+            self.counters["ejections"] += 1
+            print(f"警告: 后端 {self.name} 连续失败，摘除 {self.eject_seconds} 秒")
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "outstanding": self.outstanding,
+            "latency_ewma": self.latency_ewma,
+            "healthy": self.healthy,
+            "rate_limit": self.limiter.stats() if self.limiter is not None else None,
+        }
+
+
+class Backend:
+    """路由候选：共享的后端状态 + 指向该后端的模型实例"""
+
+    def __init__(self, state: BackendState, model: BaseChatModel):
+        self.state = state
+        self.model = model
+
+
+def pick_backend(backends: List[Backend], exclude: Iterable[Backend] = ()) -> Optional[Backend]:
+    """按最少在途请求与延迟选择后端；健康后端都不可用时退回最早恢复的被摘除后端"""
+    candidates = [backend for backend in backends if backend not in exclude]
+    if not candidates:
+        return None
+    healthy = [backend for backend in candidates if backend.state.healthy]
+    if healthy:
+        return min(healthy, key=lambda backend: backend.state.load_score())
+    return min(candidates, key=lambda backend: backend.state.ejected_until)
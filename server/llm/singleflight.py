@@ -0,0 +1,116 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+
+
+class _Flight:
+    """一次在途的非流式调用"""
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class _StreamFlight:
+    """一次在途的流式调用，底层流在独立任务中读取并缓冲，所有读者从头回放"""
+
+    def __init__(self, source: AsyncIterator):
+        self.chunks: List[Any] = []
+        self.finished = False
+        self.error = None
+        self.readers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator) -> None:
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def read(self) -> AsyncIterator:
+        index = 0
+        while True:
+            if index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+                continue
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """合并相同key的在途请求：同一时刻只发起一次真实调用，其余调用方等待同一结果
+
+    真实调用运行在独立任务中，单个调用方取消不会影响其他调用方；
+    所有调用方都离开后才取消真实调用
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+        self.counters = {
+            "calls": 0,
+            "coalesced": 0,
+        }
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "in_flight": len(self._calls) + len(self._streams),
+        }
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]) -> Any:
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._calls[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._calls, key, flight))
+            self.counters["calls"] += 1
+        else:
+            self.counters["coalesced"] += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator]) -> AsyncIterator:
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _StreamFlight(fn())
+            self._streams[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._streams, key, flight))
+            self.counters["calls"] += 1
+        else:
+            self.counters["coalesced"] += 1
+
+        flight.readers += 1
+        try:
+            async for chunk in flight.read():
+                yield chunk
+        finally:
+            flight.readers -= 1
+            if flight.readers == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    @staticmethod
+    def _forget(flights: Dict, key: str, flight) -> None:
+        if flights.get(key) is flight:
+            del flights[key]
@@ -0,0 +1,18 @@
+def _char_tokens(ch: str) -> float:
+    """单个字符的近似token数：中日韩字符约0.6个token，其余约0.25个"""
+    return 0.6 if ord(ch) >= 0x2E80 else 0.25
+
+
+def estimate_tokens(text: str) -> int:
+    """不依赖分词器的token数估算，用于预算控制"""
+    return int(sum(_char_tokens(ch) for ch in text)) + 1 if text else 0
+
+
+def truncate_tokens(text: str, max_tokens: int, suffix: str = "...") -> str:
+    """按估算token数截断文本"""
+    total = 0.0
+    for i, ch in enumerate(text):
+        total += _char_tokens(ch)
+        if total > max_tokens:
+            return text[:i] + suffix
+    return text
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import AsyncIterable, Dict, List, Optional
+
+
+class TraceRecorder:
+    """将一次运行的事件按相对时间写入trace文件（每行一个{"t", "event"}）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._start = time.monotonic()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写入临时文件，运行完整结束后再改名，避免回放读到半个trace
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, "w", encoding="utf-8", buffering=1)
+
+    def record(self, event: Dict) -> None:
+        line = {"t": round(time.monotonic() - self._start, 3), "event": event}
+        self._file.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+
+class TraceStore:
+    """按run id索引trace目录，事件在首次回放时才从磁盘加载"""
+
+    def __init__(self, trace_dir: str, max_loaded: int = 16):
+        self.trace_dir = trace_dir
+        self.max_loaded = max_loaded
+        self._loaded: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def run_ids(self) -> List[str]:
+        if not os.path.isdir(self.trace_dir):
+            return []
+        return sorted(name[:-len(".jsonl")] for name in os.listdir(self.trace_dir) if name.endswith(".jsonl"))
+
+    def path(self, run_id: str) -> str:
+        return os.path.join(self.trace_dir, f"{run_id}.jsonl")
+
+    def load(self, run_id: str) -> List[Dict]:
+        """读取trace中的全部事件，文件修改后自动重新加载"""
+        path = self.path(run_id)
+        if not os.path.exists(path):
+            raise KeyError(f"Trace {run_id} not found")
+        mtime = os.path.getmtime(path)
+        cached = self._loaded.get(run_id)
+        if cached is not None and cached[0] == mtime:
+            self._loaded.move_to_end(run_id)
+            return cached[1]
+
+        with open(path, "r", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        self._loaded[run_id] = (mtime, entries)
+        while len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
+        return entries
+
+    def recorder(self, run_id: str) -> TraceRecorder:
+        return TraceRecorder(self.path(run_id))
+
+    async def replay(self, run_id: str, speed: float = 1.0, from_iteration: int = 0,
+                     interval: Optional[float] = None) -> AsyncIterable[Dict]:
+        """回放trace中的事件
+
+        speed为1时按原始录制时间推送，大于1加速，为0时不等待；
+        interval不为空时忽略录制时间，每条事件之间固定等待interval秒；
+        from_iteration可跳过之前的迭代，从指定迭代开始回放
+        """
+        entries = [entry for entry in self.load(run_id) if entry["event"].get("iteration", 0) >= from_iteration]
+        if not entries:
+            return
+
+        offset = entries[0]["t"]
+        started = time.monotonic()
+        for i, entry in enumerate(entries):
+            if interval is not None:
+                if i > 0:
+                    await asyncio.sleep(interval)
+            elif speed > 0:
+                delay = (entry["t"] - offset) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield entry["event"]
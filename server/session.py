@@ -0,0 +1,395 @@
+import asyncio
+import json
+import math
+import uuid
+from collections import defaultdict
+from typing import AsyncIterable, Callable, Dict, List, Optional, Set
+
+from configs import EARLY_CANCEL_LOW_SCORES, AGENT_TURN_MODE, AGENT_MEMORY, ITERATION_QUORUM, CONTEXT_UPDATE_MODE
+from server.agents import ContextAgent
+from server.agents.base import BaseAgent
+from server.agents.memory import AgentMemory, MemorySummarizer
+from server.agents.response import parse_score
+
+
+class AgentPool:
+    """可复用的agent对象池，只持有prompt与模型，不保存任何模拟状态"""
+
+    def __init__(self, agents: Dict[str, BaseAgent], context_agent: ContextAgent,
+                 summarizer: Optional[MemorySummarizer] = None):
+        self.agents = agents
+        self.context_agent = context_agent
+        self.summarizer = summarizer
+
+    def create_session(self, initial_context: Dict, **options) -> "SimulationSession":
+        """基于共享对象创建一次独立的模拟会话，options为SimulationSession的运行参数"""
+        return SimulationSession(self, initial_context, **options)
+
+
+class SimulationSession:
+    """单次模拟运行，独占agent记忆、经济上下文与迭代计数
+
+    quorum（比例）或quorum_count（个数）、round_deadline与late_policy控制每轮等待agent响应的策略，见ITERATION_QUORUM；
+    context_mode为经济上下文的更新方式，见CONTEXT_UPDATE_MODE
+    """
+
+    def __init__(self, pool: AgentPool, initial_context: Dict, streaming: bool = False,
+                 early_cancel: bool = EARLY_CANCEL_LOW_SCORES, turn_mode: str = AGENT_TURN_MODE,
+                 quorum: float = ITERATION_QUORUM["quorum"],
+                 quorum_count: Optional[int] = ITERATION_QUORUM["quorum_count"],
+                 round_deadline: Optional[float] = ITERATION_QUORUM["deadline"],
+                 late_policy: str = ITERATION_QUORUM["late_policy"], context_mode: str = CONTEXT_UPDATE_MODE,
+                 run_id: Optional[str] = None):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.streaming = streaming
+        self.early_cancel = early_cancel
+        self.turn_mode = turn_mode
+        if not 0 < quorum <= 1:
+            raise ValueError(f"quorum must be a fraction in (0, 1], got {quorum}")
+        if quorum_count is not None and quorum_count < 1:
+            raise ValueError(f"quorum_count must be a positive integer, got {quorum_count}")
+        self.quorum = quorum
+        self.quorum_count = quorum_count
+        self.round_deadline = round_deadline
+        self.late_policy = late_policy
+        self.agents = pool.agents
+        self.context_agent = pool.context_agent.fork(initial_context, mode=context_mode)
+        self.agent_memories: Dict[str, AgentMemory] = defaultdict(lambda: AgentMemory(
+            token_budget=AGENT_MEMORY["token_budget"],
+            recent_tokens=AGENT_MEMORY["recent_tokens"],
+            summarizer=pool.summarizer,
+        ))
+        self.iteration = 0
+        # 本次运行agent调用的token用量，cached_tokens为命中服务商前缀缓存的部分
+        self.usage = {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+        # 运行过程中产生的实时事件，由SSE迭代器在等待任务期间转发
+        self.events: asyncio.Queue = asyncio.Queue()
+        # 上一轮未在截止前返回、仍在后台进行的响应：(任务, 本轮输入, 迭代, 输入中已包含的收件箱记录数)
+        self._late: List[tuple] = []
+        # 本轮构建输入时各agent收件箱中的记录数
+        self._consumed: Dict[str, int] = {}
+        # 会话创建的所有在途任务，中止时统一取消
+        self._tasks: Set[asyncio.Task] = set()
+        # 中止原因，为None表示运行未被中止
+        self.aborted: Optional[str] = None
+
+    def snapshot(self, **loop_state) -> Dict:
+        """导出迭代之间的会话状态，loop_state为运行循环自身的状态（如下一轮的发起者与刺激）"""
+        return {
+            **loop_state,
+            "iteration": self.iteration,
+            "usage": dict(self.usage),
+            "context": self.context_agent.get_context().to_dict(),
+            "context_history": self.context_agent.state.history_dicts(),
+            "memories": {name: memory.to_dict() for name, memory in self.agent_memories.items()},
+        }
+
+    def restore(self, state: Dict) -> None:
+        """从snapshot恢复迭代计数、用量、经济数据历史与agent记忆，当前上下文在创建会话时传入"""
+        self.iteration = state["iteration"]
+        self.usage.update(state.get("usage", {}))
+        self.context_agent.state.load_history(state.get("context_history", []))
+        for name, memory_state in state.get("memories", {}).items():
+            self.agent_memories[name].load(memory_state)
+
+    def emit(self, event_type: str, data: Dict, iteration: int) -> None:
+        """推送一条实时事件"""
+        self.events.put_nowait({
+            "type": event_type,
+            "data": data,
+            "iteration": iteration
+        })
+
+    async def drain(self, task: asyncio.Task) -> AsyncIterable[Dict]:
+        """在task完成前持续产出已推送的事件，task结束后清空剩余事件"""
+        while True:
+            getter = asyncio.ensure_future(self.events.get())
+            done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield getter.result()
+                continue
+            getter.cancel()
+            break
+        while not self.events.empty():
+            yield self.events.get_nowait()
+
+    def spawn(self, coro, name: Optional[str] = None) -> asyncio.Task:
+        """创建属于本会话的任务，会话中止或结束时一并取消"""
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def abort(self, reason: str) -> None:
+        """中止会话，取消所有在途的agent、上下文与迟到响应任务，释放LLM调用与限流配额"""
+        if self.aborted is None:
+            self.aborted = reason
+        for task in list(self._tasks):
+            task.cancel()
+        for task, *_ in self._late:
+            task.cancel()
+
+    def close(self) -> None:
+        """结束会话，取消仍在后台进行的记忆摘要、迟到的响应与其他未完成的任务"""
+        for memory in self.agent_memories.values():
+            memory.close()
+        for task in list(self._tasks):
+            task.cancel()
+        for task, *_ in self._late:
+            task.cancel()
+        self._late.clear()
+
+    def _delta_callback(self, name: str, iteration_num: int):
+        """流式模式下逐段推送action_detail的回调"""
+        if not self.streaming:
+            return None
+
+        def on_delta(key, text):
+            if key == "action_detail":
+                self.emit("agent_delta", {"agent": name, "delta": text}, iteration_num)
+        return on_delta
+
+    def _emit_response(self, resp: Dict, iteration_num: int) -> None:
+        response = resp["response"]
+        self.emit("agent_response", {
+            "agent": resp["agent"],
+            "score": response.score,
+            "action": response.action or "N/A",
+            "action_detail": response.action_detail or "N/A",
+            "cancelled": response.cancelled,
+            "timed_out": response.timed_out
+        }, iteration_num)
+
+    async def agent_raise(self, initiator, content, current_context, iteration_num=0):
+        # 先把上一轮迟到的响应写入记忆，保证对话记录按轮次追加
+        self._fold_late(iteration_num)
+        responders = {name: agent for name, agent in self.agents.items() if name != initiator}
+        # 提交回合时只移出输入中已包含的收件箱记录
+        self._consumed = {name: len(self.agent_memories[name].inbox) for name in responders}
+        # 本轮每个agent的完整输入（收件箱中的新进展、当前状态与刺激），回合结束后追加到对话记录
+        turn_inputs = {
+            name: agent.build_input(self.agent_memories[name].next_input(content), current_context)
+            for name, agent in responders.items()
+        }
+        if self.turn_mode == "bid":
+            response_list = await self._raise_by_bid(responders, turn_inputs, iteration_num)
+        else:
+            response_list = await self._raise_full(responders, turn_inputs, iteration_num)
+
+        # 更新所有参与此轮的agent记忆
+        for resp in response_list:
+            self._commit_response(resp, turn_inputs[resp["agent"]], iteration_num, self._consumed[resp["agent"]])
+
+        return response_list
+
+    def _commit_response(self, resp: Dict, turn_input: str, iteration_num: int, consumed: Optional[int] = None) -> None:
+        output = resp["response"].to_dict()
+        self.agent_memories[resp["agent"]].commit(turn_input, json.dumps(output, ensure_ascii=False), iteration_num,
+                                                  consumed)
+        self._add_usage(resp["response"].usage)
+
+    def _quorum_size(self, total: int) -> int:
+        if self.quorum_count is not None:
+            return min(total, self.quorum_count)
+        return max(1, math.ceil(total * self.quorum))
+
+    async def _gather_quorum(self, tasks: List[asyncio.Task], turn_inputs: Dict[str, str], iteration_num: int,
+                             on_result: Callable[[Dict], None]) -> List[Dict]:
+        """收集各agent的响应，达到quorum或超过round_deadline后返回已到达的响应
+
+        至少等待一个响应；未完成的任务按late_policy取消或留到下一轮写入记忆
+        """
+        needed = self._quorum_size(len(tasks))
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + self.round_deadline if self.round_deadline is not None else None
+        results = []
+        pending = set(tasks)
+        while pending and len(results) < needed:
+            timeout = None
+            if deadline_at is not None and results:
+                timeout = max(deadline_at - loop.time(), 0)
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            # 保持与任务创建顺序一致，便于复现
+            for task in sorted(done, key=tasks.index):
+                resp = task.result()
+                results.append(resp)
+                on_result(resp)
+
+        if pending:
+            late_agents = [task.get_name() for task in pending]
+            print(f"迭代{iteration_num}: {len(results)}/{len(tasks)} 个agent已响应，不再等待: {', '.join(late_agents)}")
+            self.emit("agent_late", {"agents": late_agents, "policy": self.late_policy}, iteration_num)
+            for task in pending:
+                if self.late_policy == "fold":
+                    name = task.get_name()
+                    self._late.append((task, turn_inputs[name], iteration_num, self._consumed[name]))
+                else:
+                    task.cancel()
+        return results
+
+    def _fold_late(self, iteration_num: int) -> None:
+        """把上一轮迟到但已完成的响应写入对应agent的记忆，仍未完成的直接取消"""
+        for task, turn_input, late_iteration, consumed in self._late:
+            if not task.done():
+                task.cancel()
+                continue
+            if task.cancelled() or task.exception() is not None:
+                continue
+            resp = task.result()
+            self._commit_response(resp, turn_input, late_iteration, consumed)
+            self.emit("agent_late_response", {
+                "agent": resp["agent"],
+                "score": resp["response"].score,
+                "action": resp["response"].action or "N/A",
+                "iteration": late_iteration
+            }, iteration_num)
+        self._late.clear()
+
+    def _add_usage(self, usage: Optional[Dict]) -> None:
+        for key, value in (usage or {}).items():
+            self.usage[key] = self.usage.get(key, 0) + value
+
+    async def _raise_full(self, responders, turn_inputs, iteration_num):
+        """每个agent直接生成完整响应"""
+        # 本轮已知的最高分及其agent，用于提前取消不可能胜出的生成；当前领先者始终不取消，
+        # 否则全员低分时胜出者的action会被截断
+        round_best = {"score": None, "agent": None}
+
+        def stopper(name):
+            def should_stop(values):
+                score = parse_score(values.get("score"))
+                if score is None:
+                    return False
+                if round_best["score"] is None or score > round_best["score"]:
+                    round_best["score"], round_best["agent"] = score, name
+                if round_best["agent"] == name:
+                    return False
+                return score < round_best["score"]
+            return should_stop
+
+        async def process_agent_response(name, agent):
+            """处理单个agent的响应"""
+            response = await agent.start(
+                turn_inputs[name],
+                history=self.agent_memories[name].messages(),
+                on_delta=self._delta_callback(name, iteration_num),
+                should_stop=stopper(name) if self.early_cancel else None
+            )
+            return {
+                "agent": name,
+                "response": response
+            }
+
+        tasks = []
+        for name, agent in responders.items():
+            # 创建协程任务，任务名为agent名，用于处理迟到的响应
+            task = self.spawn(process_agent_response(name, agent), name=name)
+            tasks.append(task)
+
+        # 并行执行所有任务，每个agent完成后立即推送其响应
+        return await self._gather_quorum(
+            tasks, turn_inputs, iteration_num, lambda resp: self._emit_response(resp, iteration_num)
+        )
+
+    async def _raise_by_bid(self, responders, turn_inputs, iteration_num):
+        """两阶段回合：所有agent先竞价，只有最高分agent生成完整的action_detail"""
+        async def process_bid(name, agent):
+            bid = await agent.bid(turn_inputs[name], history=self.agent_memories[name].messages())
+            return {
+                "agent": name,
+                "response": bid
+            }
+
+        async def process_detail(resp):
+            name = resp["agent"]
+            bid_usage = resp["response"].usage
+            resp["response"] = await responders[name].detail(
+                turn_inputs[name],
+                resp["response"],
+                history=self.agent_memories[name].messages(),
+                on_delta=self._delta_callback(name, iteration_num)
+            )
+            self._add_usage(bid_usage)
+            return resp
+
+        def on_bid(resp):
+            self.emit("agent_bid", {
+                "agent": resp["agent"],
+                "score": resp["response"].score,
+                "action": resp["response"].action or "N/A"
+            }, iteration_num)
+
+        bids = await self._gather_quorum([
+            self.spawn(process_bid(name, agent), name=name) for name, agent in responders.items()
+        ], turn_inputs, iteration_num, on_bid)
+        if not bids:
+            return bids
+
+        max_score = max(resp["response"].score for resp in bids)
+        winners = [resp for resp in bids if resp["response"].score == max_score]
+        for next_done in asyncio.as_completed([self.spawn(process_detail(resp)) for resp in winners]):
+            self._emit_response(await next_done, iteration_num)
+        return bids
+
+    async def agent_announce(self, resp_list, iteration_num: Optional[int] = None):
+        """处理所有得分最高的agents"""
+        # 打印所有agent的响应
+        iter_text = f"迭代 {iteration_num}" if iteration_num is not None else "初始响应"
+        print(f"\n{'=' * 20} {iter_text} {'=' * 20}")
+        print(f"{'Agent':<10} {'Score':<8} {'Action':<20} {'Action Detail'}")
+        print("-" * 70)
+
+        # 按分数排序显示
+        sorted_responses = sorted(
+            resp_list,
+            key=lambda x: x['response'].score,
+            reverse=True
+        )
+        for resp in sorted_responses:
+            agent = resp['agent']
+            score = resp['response'].score
+            action = resp['response'].action or 'N/A'
+            detail = resp['response'].action_detail or 'N/A'
+            if len(detail) > 40:
+                detail = detail[:37] + "..."
+            print(f"{agent:<10} {score:<8} {action:<20} {detail}")
+
+        # 找出最高分数
+        max_score = max(resp['response'].score for resp in resp_list)
+        # 筛选所有达到最高分的agents
+        highest_score_agents = [resp for resp in resp_list if resp['response'].score == max_score]
+
+        # 被取消、超时、解析失败或没有行动的响应不宣布，也不写入记忆与上下文
+        executed = []
+        print(f"\n执行所有最高分agent (分数: {max_score}):")
+        for agent in highest_score_agents:
+            agent_name = agent['agent']
+            response = agent['response']
+            action = response.action
+            action_detail = response.action_detail
+            if response.cancelled or response.timed_out or response.parse_path == "failed" or not action:
+                print(f"- {agent_name} 的响应不完整，跳过")
+                continue
+            executed.append(agent)
+
+            print(f"- {agent_name} 执行: {action}")
+
+            # 记录高分agent的行动到所有agent的记忆中
+            action_record = f"{agent_name}执行了: {action}，详情: {action_detail}"
+            for name in self.agents.keys():
+                if name != agent_name:  # 不需要记录自己的行动
+                    self.agent_memories[name].add(
+                        agent_name, action_record, iteration_num if iteration_num is not None else 0
+                    )
+
+            # 使用context_agent更新上下文
+            on_delta = None
+            if self.streaming:
+                def on_delta(text, agent_name=agent_name):
+                    self.emit("context_delta", {"agent": agent_name, "delta": text},
+                              iteration_num if iteration_num is not None else 0)
+            await self.context_agent.update_context(agent_name, action, action_detail, on_delta=on_delta)
+
+        return executed[0] if executed else None, max_score
@@ -1,127 +1,78 @@
 import asyncio
+import itertools
 import json
-from collections import defaultdict
+import time
 
 from server.agents import ContextAgent
-from configs import stimulus_inducer, MIN_SCORE_THRESHOLD, MAX_ITERATIONS, context
+from server.agents.context_agent import CONTEXT_MODES
+from server.session import AgentPool, SimulationSession
+from server.agents.memory import MemorySummarizer
+from server.replay import TraceStore
+from server.store import RunStore
+from server.lifecycle import drain_state
+from server.jobs import JobManager, JobPoolSaturated
+from server.broadcast import Broadcast, Subscriber
+from configs import stimulus_inducer, MIN_SCORE_THRESHOLD, MAX_ITERATIONS, STREAM_AGENT_OUTPUT, AGENT_TURN_MODE, AGENT_MEMORY, REPLAY, RUN_STORE, SIMULATION_JOBS, BROADCAST, CONTEXT_UPDATE_MODE, context
 from server.agents import ChinaAgent, CanadaAgent, VietnamAgent, USAgent
 
-from typing import AsyncIterable
-from fastapi.responses import StreamingResponse
-
-context_agent = ContextAgent(initial_context=context, model_name="deepseek-v3")
-
-iteration = 1
-
-# 参与模拟的agent列表
-agents = {
-    "us": USAgent("deepseek-v3"),
-    "china": ChinaAgent("deepseek-v3"),
-    # "canada": CanadaAgent("deepseek-v3"),
-    # "vietnam": VietnamAgent("deepseek-v3")
-}
-
-agent_memories = defaultdict(list)
-
-async def agent_raise(initiator, content, current_context, iteration_num=0):
-    async def process_agent_response(name, agent, content, agent_context):
-        """处理单个agent的响应"""
-        # 获取当前agent的历史记忆
-        memory = agent_memories[name]
-        memory_text = ""
-        if memory:
-            memory_text = "\n\n历史交互记录:\n" + "\n".join([
-                f"迭代{i + 1}: {mem['initiator']}说: {mem['content'][:100]}{'...' if len(mem['content']) > 100 else ''}"
-                for i, mem in enumerate(memory)
-            ])
-
-        # 向agent提供带有记忆的增强输入
-        enhanced_content = f"{content}{memory_text}"
-        response = await agent.start(enhanced_content, context=agent_context)
-        return {
-            "agent": name,
-            "response": response
-        }
-
-    tasks = []
-    for name, agent in agents.items():
-        if name != initiator:
-            # 为每个agent获取当前上下文的副本
-            agent_context = current_context.copy()
-            # 创建协程任务
-            task = asyncio.create_task(process_agent_response(name, agent, content, agent_context))
-            tasks.append(task)
-
-    # 并行执行所有任务
-    response_list = await asyncio.gather(*tasks)
-
-    # 更新所有参与此轮的agent记忆
-    for resp in response_list:
-        agent_name = resp["agent"]
-        agent_memories[agent_name].append({
-            "initiator": initiator,
-            "content": content,
-            "iteration": iteration_num
-        })
-
-    return response_list
-
-
-async def agent_announce(resp_list, iteration_num=None):
-    """处理所有得分最高的agents"""
-    # 打印所有agent的响应
-    iter_text = f"迭代 {iteration_num}" if iteration_num is not None else "初始响应"
-    print(f"\n{'=' * 20} {iter_text} {'=' * 20}")
-    print(f"{'Agent':<10} {'Score':<8} {'Action':<20} {'Action Detail'}")
-    print("-" * 70)
-
-    # 按分数排序显示
-    sorted_responses = sorted(
-        resp_list,
-        key=lambda x: int(x['response'].get('score', 0)),
-        reverse=True
-    )
-    for resp in sorted_responses:
-        agent = resp['agent']
-        score = resp['response'].get('score', 0)
-        action = resp['response'].get('action', 'N/A')
-        detail = resp['response'].get('action_detail', 'N/A')
-        if len(detail) > 40:
-            detail = detail[:37] + "..."
-        print(f"{agent:<10} {score:<8} {action:<20} {detail}")
-
-    # 找出最高分数
-    max_score = max(resp_list, key=lambda x: int(x['response'].get('score', 0)))['response'].get('score', 0)
-    # 筛选所有达到最高分的agents
-    highest_score_agents = [resp for resp in resp_list if int(resp['response'].get('score', 0)) == int(max_score)]
-
-    print(f"\n执行所有最高分agent (分数: {max_score}):")
-    for agent in highest_score_agents:
-        agent_name = agent['agent']
-        action = agent['response'].get('action', '')
-        action_detail = agent['response'].get('action_detail', '')
-
-        print(f"- {agent_name} 执行: {action}")
-
-        # 记录高分agent的行动到所有agent的记忆中
-        action_record = f"{agent_name}执行了: {action}，详情: {action_detail}"
-        for name in agents.keys():
-            if name != agent_name:  # 不需要记录自己的行动
-                agent_memories[name].append({
-                    "initiator": agent_name,
-                    "content": action_record,
-                    "iteration": iteration_num if iteration_num is not None else 0
-                })
-
-        # 使用context_agent更新上下文
-        await context_agent.update_context(agent_name, action, action_detail)
-
-    return highest_score_agents[0] if highest_score_agents else None, int(max_score)
-
-
-async def start() -> StreamingResponse:
-
-    async def iterator() -> AsyncIterable[str]:
+from typing import AsyncIterable, Dict, List, Optional, Tuple
+from fastapi import Header, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 参与模拟的agent对象池，prompt与模型在所有会话间共享，状态由每次运行的会话独占
+agent_pool = AgentPool(
+    agents={
+        "us": USAgent("deepseek-v3"),
+        "china": ChinaAgent("deepseek-v3"),
+        # "canada": CanadaAgent("deepseek-v3"),
+        # "vietnam": VietnamAgent("deepseek-v3")
+    },
+    context_agent=ContextAgent(initial_context=context, model_name="deepseek-v3"),
+    summarizer=MemorySummarizer("deepseek-v3") if AGENT_MEMORY["summarize"] else None,
+)
+
+# 录制与回放共用的trace存储
+trace_store = TraceStore(REPLAY["trace_dir"])
+_replay_counter = itertools.count()
+
+# 运行结果的持久化存储
+run_store = RunStore(
+    RUN_STORE["path"],
+    batch_size=RUN_STORE["batch_size"],
+    flush_interval=RUN_STORE["flush_interval"],
+) if RUN_STORE["enabled"] else None
+
+
+# 后台模拟的工作池
+job_manager = JobManager(
+    max_workers=SIMULATION_JOBS["max_workers"],
+    max_queued=SIMULATION_JOBS["max_queued"],
+    buffer_size=SIMULATION_JOBS["buffer_events"],
+    retention=SIMULATION_JOBS["retention"],
+    default_retry_after=SIMULATION_JOBS["retry_after"],
+)
+
+# 正在进行的共享运行，按(stream, turn_mode, context_mode, record)区分
+_shared_runs: Dict[Tuple, Tuple[Broadcast, SimulationSession, asyncio.Task]] = {}
+# 共享运行的生产任务，保持引用直到任务结束（包括已移出_shared_runs、正在收尾的任务）
+_producers = set()
+
+# 当前进程中正在运行的run id，避免同一运行被重复恢复
+_active_runs = set()
+
+
+async def run_simulation(session: SimulationSession, checkpoint: Optional[Dict] = None) -> AsyncIterable[Dict]:
+    """驱动一次模拟会话直到终止，依次产出运行事件
+
+    传入checkpoint时从检查点记录的下一轮继续，不再推送初始刺激；
+    每轮结束后保存检查点，已完成迭代的LLM调用在恢复时不会重复
+    """
+    if checkpoint is not None:
+        initiator = checkpoint["initiator"]
+        content = checkpoint["content"]
+        highest_score = checkpoint["highest_score"]
+        print(f"\n{'='*20} 从迭代 {session.iteration} 继续运行 {session.run_id} {'='*20}")
+    else:
         # 初始设置
         initiator = stimulus_inducer["name"]
         content = stimulus_inducer["content"]
@@ -138,1118 +89,529 @@ async def start() -> StreamingResponse:
             },
             "iteration": 0
         }
-        yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+        yield data
 
         highest_score = 100
-        iteration_count = 0
-
-        # 合并初始响应和迭代循环
-        while highest_score > MIN_SCORE_THRESHOLD and iteration_count <= MAX_ITERATIONS:
-            # 获取当前上下文
-            current_context = context_agent.get_context()
-
-            # 返回迭代开始信息
-            iter_text = "初始响应" if iteration_count == 0 else f"迭代 {iteration_count}"
-            data = {
-                "type": "iteration_start",
-                "data": {
-                    "iteration_text": iter_text,
-                    "initiator": initiator,
-                    "content": content
-                },
-                "iteration": iteration_count
-            }
-            yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-            # 获取响应
-            resp_list = await agent_raise(
+    # 合并初始响应和迭代循环
+    while highest_score > MIN_SCORE_THRESHOLD and session.iteration <= MAX_ITERATIONS:
+        # 获取当前上下文
+        current_context = session.context_agent.get_context()
+
+        # 返回迭代开始信息
+        iter_text = "初始响应" if session.iteration == 0 else f"迭代 {session.iteration}"
+        data = {
+            "type": "iteration_start",
+            "data": {
+                "iteration_text": iter_text,
+                "initiator": initiator,
+                "content": content
+            },
+            "iteration": session.iteration
+        }
+        yield data
+
+        # 获取响应，各agent的响应在返回时即逐条推送
+        raise_task = session.spawn(session.agent_raise(
+            initiator=initiator,
+            content=content,
+            current_context=current_context,
+            iteration_num=session.iteration
+        ))
+        async for event in session.drain(raise_task):
+            yield event
+        if session.aborted:
+            return
+        resp_list = raise_task.result()
+
+        # 处理高分agents并返回所有响应
+        formatted_responses = []
+        for resp in sorted(resp_list,
+                          key=lambda x: x['response'].score,
+                          reverse=True):
+            agent = resp['agent']
+            score = resp['response'].score
+            action = resp['response'].action or 'N/A'
+            detail = resp['response'].action_detail or 'N/A'
+            print(f"{agent:<10} {score:<8} {action:<20} {detail[:37] + '...' if len(detail) > 40 else detail}")
+
+            formatted_responses.append({
+                "agent": agent,
+                "score": score,
+                "action": action,
+                "action_detail": detail
+            })
+
+        data = {
+            "type": "agent_responses",
+            "data": {
+                "responses": formatted_responses
+            },
+            "iteration": session.iteration
+        }
+        yield data
+
+        # 处理高分agents
+        announce_task = session.spawn(session.agent_announce(
+            resp_list,
+            None if session.iteration == 0 else session.iteration
+        ))
+        async for event in session.drain(announce_task):
+            yield event
+        if session.aborted:
+            return
+        highest_response, highest_score = announce_task.result()
+
+        # 返回最高分agent执行结果
+        highest_agents_data = []
+        if highest_response:
+            highest_agents_data.append({
+                "agent": highest_response['agent'],
+                "action": highest_response['response'].action,
+                "action_detail": highest_response['response'].action_detail
+            })
+
+        data = {
+            "type": "agent_announce",
+            "data": {
+                "score": highest_score,
+                "agents": highest_agents_data
+            },
+            "iteration": session.iteration
+        }
+        yield data
+
+        # 处理经济数据，本轮结果记入历史
+        print("\n当前经济数据:")
+        economic_data = session.context_agent.commit_round().to_dict()
+        for country, data in economic_data.items():
+            print(f"{country}: " + ", ".join(f"{key}={value}" for key, value in data.items()))
+
+        data = {
+            "type": "economic_data",
+            "data": economic_data,
+            "iteration": session.iteration
+        }
+
+        # 为下一次迭代更新参数
+        if highest_response:
+            initiator = highest_response['agent']
+            content = highest_response['response'].action_detail
+
+        session.iteration += 1
+
+        # 在推送本轮最后一个事件之前保存检查点：客户端收到经济数据后断开时，恢复从下一轮开始，不重做本轮
+        if run_store is not None:
+            run_store.save_checkpoint(session.run_id, session.iteration, session.snapshot(
                 initiator=initiator,
                 content=content,
-                current_context=current_context,
-                iteration_num=iteration_count
-            )
-
-            # 处理高分agents并返回所有响应
-            formatted_responses = []
-            for resp in sorted(resp_list,
-                              key=lambda x: int(x['response'].get('score', 0)),
-                              reverse=True):
-                agent = resp['agent']
-                score = resp['response'].get('score', 0)
-                action = resp['response'].get('action', 'N/A')
-                detail = resp['response'].get('action_detail', 'N/A')
-                print(f"{agent:<10} {score:<8} {action:<20} {detail[:37] + '...' if len(detail) > 40 else detail}")
-
-                formatted_responses.append({
-                    "agent": agent,
-                    "score": score,
-                    "action": action,
-                    "action_detail": detail
-                })
-
-            data = {
-                "type": "agent_responses",
-                "data": {
-                    "responses": formatted_responses
-                },
-                "iteration": iteration_count
-            }
-            yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+                highest_score=highest_score,
+            ))
+        yield data
+
+    # 迭代结束，返回总结信息
+    termination_reason = '达到最大迭代次数' if session.iteration > MAX_ITERATIONS else '低于最小分数阈值'
+    print(f"\n{'=' * 20} 迭代结束 {'=' * 20}")
+    print(f"总迭代次数: {session.iteration - 1}")
+    print(f"终止原因: {termination_reason}")
+    usage = session.usage
+    print(f"token用量: 输入{usage['input_tokens']}（缓存命中{usage['cached_tokens']}） 输出{usage['output_tokens']}")
+
+    data = {
+        "type": "iteration_end",
+        "data": {
+            "total_iterations": session.iteration - 1,
+            "termination_reason": termination_reason,
+            "usage": usage,
+            "economic_history": session.context_agent.state.history_dicts()
+        },
+        "iteration": session.iteration - 1
+    }
+    yield data
+
+
+def _check_context_mode(context_mode: str) -> None:
+    if context_mode not in CONTEXT_MODES:
+        raise HTTPException(status_code=400, detail=f"context_mode must be one of {', '.join(CONTEXT_MODES)}")
+
+
+async def _watch_disconnect(request: Request, session: SimulationSession, interval: float = 0.5) -> None:
+    """轮询客户端连接状态，断开后中止会话"""
+    while not await request.is_disconnected():
+        await asyncio.sleep(interval)
+    session.abort("client_disconnected")
+
+
+def _aborted_event(session: SimulationSession) -> Dict:
+    return {
+        "type": "run_aborted",
+        "data": {
+            "run_id": session.run_id,
+            "reason": session.aborted,
+            "usage": session.usage
+        },
+        "iteration": session.iteration
+    }
+
+
+async def _run_events(session: SimulationSession, record: bool = False,
+                      checkpoint: Optional[Dict] = None) -> AsyncIterable[Dict]:
+    """运行会话并产出事件，同时写入trace与运行记录
+
+    会话被中止时以run_aborted事件结尾；迭代器被提前关闭（客户端断开或服务端取消）时中止会话，
+    run_aborted只写入记录
+    """
+    _active_runs.add(session.run_id)
+    drain_state.active_runs += 1
+    recorder = trace_store.recorder(session.run_id) if record else None
+
+    def persist(data: Dict) -> None:
+        if recorder is not None:
+            recorder.record(data)
+        if run_store is not None:
+            run_store.append(session.run_id, data)
+
+    completed = False
+    aborted_recorded = False
+    try:
+        if not session.aborted:
+            async for data in run_simulation(session, checkpoint):
+                persist(data)
+                yield data
+        completed = not session.aborted
+        if session.aborted:
+            print(f"\n运行 {session.run_id} 已中止（{session.aborted}），完成迭代数: {session.iteration}")
+            aborted_recorded = True
+            event = _aborted_event(session)
+            persist(event)
+            yield event
+    except Exception:
+        session.abort("error")
+        raise
+    finally:
+        drain_state.active_runs -= 1
+        _active_runs.discard(session.run_id)
+        if not completed and not aborted_recorded:
+            # 排空超时时由服务端取消，否则是客户端已经断开，两种情况都可以之后从检查点恢复
+            session.abort("server_shutdown" if drain_state.draining else "client_disconnected")
+            print(f"\n运行 {session.run_id} 已中止（{session.aborted}），完成迭代数: {session.iteration}")
+            persist(_aborted_event(session))
+        if run_store is not None:
+            run_store.finish(session.run_id, "completed" if completed else "aborted")
+        session.close()
+        if recorder is not None:
+            recorder.close()
+
+
+async def start(request: Request, stream: bool = STREAM_AGENT_OUTPUT, turn_mode: str = AGENT_TURN_MODE,
+                record: bool = REPLAY["record_live_runs"], shared: bool = BROADCAST["share_start"],
+                context_mode: str = CONTEXT_UPDATE_MODE) -> StreamingResponse:
+    """运行一次模拟
+
+    stream为True时额外推送agent_delta/context_delta增量事件；
+    turn_mode为"bid"时agent先竞价，只有最高分agent生成完整响应；
+    record为True时将本次运行录制为trace，可通过fake_start回放。
+    context_mode为经济数据的更新方式（llm/numeric/hybrid），numeric不为经济数据调用LLM，结果可复现。
+    shared为True时加入参数相同的正在进行的运行，多个观众共享同一次LLM调用，最后一个观众离开时运行中止。
+    客户端断开连接后立即取消所有在途的LLM调用，中止的运行以run_aborted事件结尾记录在trace中
+    """
+    drain_state.check_accepting()
+    _check_context_mode(context_mode)
+    if shared:
+        return _join_shared_run(request, stream, turn_mode, record, context_mode)
+    # 每次请求创建独立会话，运行结束后记忆与上下文随会话一起释放
+    options = {"stream": stream, "turn_mode": turn_mode, "context_mode": context_mode}
+    session = agent_pool.create_session(context, streaming=stream, turn_mode=turn_mode, context_mode=context_mode)
+    if run_store is not None:
+        run_store.begin(session.run_id, options)
+    return _stream_session(request, session, record=record)
+
+
+def _join_shared_run(request: Request, stream: bool, turn_mode: str, record: bool,
+                     context_mode: str) -> StreamingResponse:
+    """订阅共享运行，没有正在进行的运行时创建一个"""
+    key = (stream, turn_mode, context_mode, record)
+    if key not in _shared_runs:
+        session = agent_pool.create_session(context, streaming=stream, turn_mode=turn_mode, context_mode=context_mode)
+        if run_store is not None:
+            run_store.begin(session.run_id, {"stream": stream, "turn_mode": turn_mode, "context_mode": context_mode,
+                                             "shared": True})
+        broadcast = Broadcast(BROADCAST["queue_size"], BROADCAST["policy"])
+        producer = asyncio.create_task(_produce_shared(key, broadcast, session, record))
+        _producers.add(producer)
+        producer.add_done_callback(_producer_done)
+        _shared_runs[key] = (broadcast, session, producer)
+    broadcast, session, _ = _shared_runs[key]
+    subscriber = broadcast.subscribe()
 
-            # 处理高分agents
-            highest_response, highest_score = await agent_announce(
-                resp_list,
-                None if iteration_count == 0 else iteration_count
-            )
-
-            # 返回最高分agent执行结果
-            highest_agents_data = []
-            if highest_response:
-                highest_agents_data.append({
-                    "agent": highest_response['agent'],
-                    "action": highest_response['response'].get('action', ''),
-                    "action_detail": highest_response['response'].get('action_detail', '')
-                })
-
-            data = {
-                "type": "agent_announce",
-                "data": {
-                    "score": highest_score,
-                    "agents": highest_agents_data
-                },
-                "iteration": iteration_count
-            }
-            yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    async def iterator() -> AsyncIterable[str]:
+        watcher = asyncio.create_task(_watch_subscriber(request, key, broadcast, subscriber, session))
+        try:
+            while True:
+                data = await subscriber.get()
+                if data is None:
+                    break
+                yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+        finally:
+            watcher.cancel()
+            _leave_shared_run(key, broadcast, subscriber, session)
 
-            # 处理经济数据
-            print("\n当前经济数据:")
-            current_context = context_agent.get_context()
-            economic_data = {}
-            for country, data in current_context.items():
-                print(f"{country}: GDP={data['GDP']}, 失业率={data['失业率']}, 通胀率={data['通胀率']}")
-                economic_data[country] = data
-
-            data = {
-                "type": "economic_data",
-                "data": economic_data,
-                "iteration": iteration_count
-            }
-            yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return StreamingResponse(
+        iterator(),
+        media_type="text/event-stream",
+    )
 
-            # 为下一次迭代更新参数
-            if highest_response:
-                initiator = highest_response['agent']
-                content = highest_response['response'].get('action_detail', '')
 
-            iteration_count += 1
+async def _produce_shared(key: Tuple, broadcast: Broadcast, session: SimulationSession, record: bool) -> None:
+    """运行共享会话，每个事件只产生一次并广播给所有订阅者"""
+    events = _run_events(session, record=record)
+    try:
+        async for data in events:
+            broadcast.publish(data)
+    finally:
+        # 被取消时也要关闭事件迭代器，写入run_aborted并结束运行记录
+        await events.aclose()
+        broadcast.close()
+        if _shared_runs.get(key, (None,))[0] is broadcast:
+            del _shared_runs[key]
+
+
+def shared_run_stats() -> Dict[str, Dict]:
+    """正在进行的共享运行的广播统计，按run id区分"""
+    return {session.run_id: broadcast.stats() for broadcast, session, _ in _shared_runs.values()}
+
+
+def _producer_done(task: asyncio.Task) -> None:
+    _producers.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"警告: 共享运行异常结束: {task.exception()!r}")
+
+
+async def _watch_subscriber(request: Request, key: Tuple, broadcast: Broadcast,
+                            subscriber: Subscriber, session: SimulationSession, interval: float = 0.5) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(interval)
+    _leave_shared_run(key, broadcast, subscriber, session)
+
+
+def _leave_shared_run(key: Tuple, broadcast: Broadcast, subscriber: Subscriber, session: SimulationSession) -> None:
+    broadcast.unsubscribe(subscriber)
+    if not broadcast.subscribers and not broadcast.finished:
+        # 最后一个观众离开，中止运行并取消生产任务；之后的请求会创建新的运行
+        session.abort("client_disconnected")
+        entry = _shared_runs.get(key)
+        if entry is not None and entry[0] is broadcast:
+            del _shared_runs[key]
+            entry[2].cancel()
+
+
+async def resume(request: Request, run_id: str) -> StreamingResponse:
+    """从最近的检查点继续一次被中断的运行，事件接续写入原运行的记录"""
+    drain_state.check_accepting()
+    store = _require_run_store()
+    run = await asyncio.to_thread(store.get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found")
+    if run["status"] == "completed" or run_id in _active_runs:
+        raise HTTPException(status_code=409, detail=f"Run {run_id} is {'running' if run_id in _active_runs else run['status']}")
+    checkpoint = await asyncio.to_thread(store.latest_checkpoint, run_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} has no checkpoint")
+
+    options = run["options"]
+    session = agent_pool.create_session(
+        checkpoint["context"],
+        streaming=options.get("stream", STREAM_AGENT_OUTPUT),
+        turn_mode=options.get("turn_mode", AGENT_TURN_MODE),
+        context_mode=options.get("context_mode", "llm"),
+        run_id=run_id,
+    )
+    session.restore(checkpoint)
+    await asyncio.to_thread(store.reopen, run_id, session.iteration)
+    return _stream_session(request, session, checkpoint=checkpoint)
 
-        # 迭代结束，返回总结信息
-        termination_reason = '达到最大迭代次数' if iteration_count > MAX_ITERATIONS else '低于最小分数阈值'
-        print(f"\n{'=' * 20} 迭代结束 {'=' * 20}")
-        print(f"总迭代次数: {iteration_count - 1}")
-        print(f"终止原因: {termination_reason}")
 
-        data = {
-            "type": "iteration_end",
-            "data": {
-                "total_iterations": iteration_count - 1,
-                "termination_reason": termination_reason
-            },
-            "iteration": iteration_count - 1
-        }
-        yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+def _stream_session(request: Request, session: SimulationSession, record: bool = False,
+                    checkpoint: Optional[Dict] = None) -> StreamingResponse:
+    """以SSE推送会话的运行事件，客户端断开后立即中止会话"""
+    async def iterator() -> AsyncIterable[str]:
+        events = _run_events(session, record=record, checkpoint=checkpoint)
+        watcher = asyncio.create_task(_watch_disconnect(request, session))
+        try:
+            async for data in events:
+                yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+        finally:
+            watcher.cancel()
+            await events.aclose()
 
     return StreamingResponse(
         iterator(),
         media_type="text/event-stream",
     )
 
-async def fake_start():
-    async def iterator():
-        data_list1 = [
-            {"type": "iteration_start", "data": {"iteration_text": "初始响应", "initiator": "us", "content": "美国总统特朗普签署行政令，宣布：对所有贸易伙伴加征10%的关税。对与美国贸易逆差最大的国家和地区征收更高的\"对等关税\""}, "iteration": 0},
-            {"type": "agent_announce", "data": {"agents": [{"agent": "china", "action": "实施报复性关税", "action_detail": "针对美国加征关税的行为，中国将采取非对称打击策略，重点对美国农产品（如大豆、玉米）和关键工业原材料（如稀土）加征报复性关税。同时，中国将利用其在稀土等关键原材料上的优势地位，限制对美国的出口，以保护国内产业链安全和推动人民币国际化。此举旨在向美国施压，促使其重新考虑贸易政策，并在谈判中争取更有利的条件。"}]}, "iteration": 0},
-            {"type": "agent_announce", "data": {"agents": [{"agent": "us_corp", "action": "扩大本土产能", "action_detail": "在关税保护政策推动下，美国车企计划扩大本土生产线，同时加快关键零部件国产化进程，以提高整体供应链稳定性。"}]}, "iteration": 0},
-            {"type": "agent_announce", "data": {"agents": [{"agent": "chine_corp", "action": "寻求多元化出口", "action_detail": "面对美国市场的关税壁垒，中国车企积极开拓‘一带一路’沿线国家市场，寻求多元化出口渠道，同时加快新能源汽车研发以增强国际市场竞争力。"}]}, "iteration": 0},
-            {
-                "type": "economic_data",
-                "data": {
-                "china": {
-                    "import_value_billion_usd": 75,
-                    "import_change_pct": -7.58,
-                    "export_value_billion_usd": 370,
-                    "export_change_pct": -11.51,
-                    "market_share_pct": 31.5,
-                    "market_share_change_pct": -5.48,
-                    "annual_production_ten_thousand_vehicles": 900,
-                    "annual_production_change_pct": -3.23,
-                    "demand_ten_thousand_vehicles": 770,
-                    "demand_change_pct": -4.94,
-                    "production_cost_ten_thousand_usd": 2.3,
-                    "production_cost_change_pct": -4.17
-                },
-                "us": {
-                    "import_value_billion_usd": 120,
-                    "import_change_pct": -11.11,
-                    "export_value_billion_usd": 65,
-                    "export_change_pct": 8.33,
-                    "market_share_pct": 10.5,
-                    "market_share_change_pct": 12.90,
-                    "annual_production_ten_thousand_vehicles": 215,
-                    "annual_production_change_pct": 7.50,
-                    "demand_ten_thousand_vehicles": 140,
-                    "demand_change_pct": -4.76,
-                    "production_cost_ten_thousand_usd": 3.15,
-                    "production_cost_change_pct": 5.00
-                }
-                },
-                "iteration": 0
-            },
-                {
-                    "type": "iteration_start",
-                    "data": {
-                        "iteration_text": "迭代 1",
-                        "initiator": "us",
-                        "content": "美国宣布对中国新能源汽车及其电池零部件加征20%关税，并启动对中国补贴政策的调查，理由是“维护美国产业公平竞争”。"
-                    },
-                    "iteration": 1
-                },
-                {
-                    "type": "agent_announce",
-                    "data": {
-                        "agents": [
-                            {
-                                "agent": "us",
-                                "action": "加征关税并调查补贴",
-                                "action_detail": "美国贸易代表办公室（USTR）将在90天内完成对中国新能源汽车补贴的全面调查，同时对相关产品征收20%关税，以限制中国新能源汽车在美市场份额。"
-                            }
-                        ]
-                    },
-                    "iteration": 1
-                },
-                {
-                    "type": "agent_announce",
-                    "data": {
-                        "agents": [
-                            {
-                                "agent": "china",
-                                "action": "对美关键原材料加征关税",
-                                "action_detail": "中国将对美国出口的锂、镍等动力电池关键原材料加征15%的报复性关税，并宣布对美国进口车加征5%附加税。"
-                            }
-                        ]
-                    },
-                    "iteration": 1
-                },
-                {
-                    "type": "agent_announce",
-                    "data": {
-                        "agents": [
-                            {
-                                "agent": "us_corp",
-                                "action": "寻求供应链多元化",
-                                "action_detail": "主要美国车企与墨西哥和加拿大电池厂商签署长期采购合约，同时评估在东南亚设立零部件工厂的可行性。"
-                            }
-                        ]
-                    },
-                    "iteration": 1
-                },
-                {
-                    "type": "agent_announce",
-                    "data": {
-                        "agents": [
-                            {
-                                "agent": "chine_corp",
-                                "action": "加速技术升级",
-                                "action_detail": "中国车企宣布增加30%的研发预算，用于固态电池与智能驾驶系统，以提升产品附加值并降低对美出口依赖。"
-                            }
-                        ]
-                    },
-                    "iteration": 1
-                },
-                {
-                    "type": "economic_data",
-                    "data": {
-                        "china": {
-                            "import_value_billion_usd": 65.63,
-                            "import_change_pct": -12.50,
-                            "export_value_billion_usd": 314.50,
-                            "export_change_pct": -15.00,
-                            "market_share_pct": 28.98,
-                            "market_share_change_pct": -8.00,
-                            "annual_production_ten_thousand_vehicles": 855,
-                            "annual_production_change_pct": -5.00,
-                            "demand_ten_thousand_vehicles": 723.80,
-                            "demand_change_pct": -6.00,
-                            "production_cost_ten_thousand_usd": 2.37,
-                            "production_cost_change_pct": 3.00
-                        },
-                        "us": {
-                            "import_value_billion_usd": 102.00,
-                            "import_change_pct": -15.00,
-                            "export_value_billion_usd": 71.50,
-                            "export_change_pct": 10.00,
-                            "market_share_pct": 12.08,
-                            "market_share_change_pct": 15.00,
-                            "annual_production_ten_thousand_vehicles": 236.50,
-                            "annual_production_change_pct": 10.00,
-                            "demand_ten_thousand_vehicles": 147.00,
-                            "demand_change_pct": 5.00,
-                            "production_cost_ten_thousand_usd": 3.21,
-                            "production_cost_change_pct": 2.00
-                        }
-                    },
-                    "iteration": 1
-                },
-
-                {
-                    "type": "iteration_start",
-                    "data": {
-                        "iteration_text": "迭代 2",
-                        "initiator": "us",
-                        "content": "美国财政部公布初步调查结果，指责中国补贴导致市场扭曲，同时暗示若中方让步可放缓关税升级。"
-                    },
-                    "iteration": 2
-                },
-                {
-                    "type": "agent_announce",
-                    "data": {
-                        "agents": [
-                            {
-                                "agent": "us",
-                                "action": "提出附带条件谈判",
-                                "action_detail": "美国建议与中国开启磋商，条件是中国削减补贴规模30%，否则将对其他输美零部件加征25%关税。"
-                            }
-                        ]
-                    },
-                    "iteration": 2
-                },
-                {
-                    "type": "agent_announce",
-                    "data": {
-                        "agents": [
-                            {
-                                "agent": "china",
-                                "action": "扩大报复关税范围",
-                                "action_detail": "中国宣布对进口美产大型排量汽车加征10%关税，并启动对美国在华企业享受税收优惠的合规审查。"
-                            }
-                        ]
-                    },
-                    "iteration": 2
-                },
-                {
-                    "type": "agent_announce",
-                    "data": {
-                        "agents": [
-                            {
-                                "agent": "us_corp",
-                                "action": "加强供应链本土化",
-                                "action_detail": "美国车企决定将关键电子控制单元(ECU)生产迁回本土，并寻求联邦补贴以抵消成本上升。"
-                            }
-                        ]
-                    },
-                    "iteration": 2
-                },
-                {
-                    "type": "agent_announce",
-                    "data": {
-                        "agents": [
-                            {
-                                "agent": "chine_corp",
-                                "action": "转向东盟与非洲市场",
-                                "action_detail": "中国车企与泰国及南非政府签署组装工厂协议，以绕过美方关税并扩大新兴市场份额。"
-                            }
-                        ]
-                    },
-                    "iteration": 2
-                },
-                {
-                    "type": "economic_data",
-                    "data": {
-                        "china": {
-                            "import_value_billion_usd": 60.00,
-                            "import_change_pct": -20.00,
-                            "export_value_billion_usd": 303.40,
-                            "export_change_pct": -18.00,
-                            "market_share_pct": 28.35,
-                            "market_share_change_pct": -10.00,
-                            "annual_production_ten_thousand_vehicles": 846,
-                            "annual_production_change_pct": -6.00,
-                            "demand_ten_thousand_vehicles": 708.40,
-                            "demand_change_pct": -8.00,
-                            "production_cost_ten_thousand_usd": 2.42,
-                            "production_cost_change_pct": 5.00
-                        },
-                        "us": {
-                            "import_value_billion_usd": 90.00,
-                            "import_change_pct": -25.00,
-                            "export_value_billion_usd": 61.75,
-                            "export_change_pct": -5.00,
-                            "market_share_pct": 11.34,
-                            "market_share_change_pct": 8.00,
-                            "annual_production_ten_thousand_vehicles": 240.80,
-                            "annual_production_change_pct": 12.00,
-                            "demand_ten_thousand_vehicles": 135.80,
-                            "demand_change_pct": -3.00,
-                            "production_cost_ten_thousand_usd": 3.34,
-                            "production_cost_change_pct": 6.00
-                        }
-                    },
-                    "iteration": 2
-                },
-
-                {
-                    "type": "iteration_start",
-                    "data": {
-                        "iteration_text": "迭代 3",
-                        "initiator": "us",
-                        "content": "在多方压力下，美国宣布暂缓对新增零部件关税，提出建立中美新能源汽车补贴透明机制的框架协议草案。"
-                    },
-                    "iteration": 3
-                },
-                {
-                    "type": "agent_announce",
-                    "data": {
-                        "agents": [
-                            {
-                                "agent": "us",
-                                "action": "暂缓部分关税并提议补贴透明框架",
-                                "action_detail": "美国将延后原定于60天后生效的额外25%关税，并邀请中国在WTO框架下共同制定新能源汽车补贴披露规则。"
-                            }
-                        ]
-                    },
-                    "iteration": 3
-                },
-                {
-                    "type": "agent_announce",
-                    "data": {
-                        "agents": [
-                            {
-                                "agent": "china",
-                                "action": "同意谈判并降低部分关税",
-                                "action_detail": "中国同意参与补贴透明机制谈判，并宣布对部分美国农产品关税减让2%，作为善意回应。"
-                            }
-                        ]
-                    },
-                    "iteration": 3
-                },
-                {
-                    "type": "agent_announce",
-                    "data": {
-                        "agents": [
-                            {
-                                "agent": "us_corp",
-                                "action": "扩大对欧盟出口计划",
-                                "action_detail": "预期关税缓和后，美国车企将利用产能过剩向欧盟市场出口高端电动车，以分散对中国零部件依赖。"
-                            }
-                        ]
-                    },
-                    "iteration": 3
-                },
-                {
-                    "type": "agent_announce",
-                    "data": {
-                        "agents": [
-                            {
-                                "agent": "chine_corp",
-                                "action": "提升绿色制造能力",
-                                "action_detail": "中国车企宣布全面升级生产线以降低碳排放，并计划在欧洲建立电池回收网络，提升品牌形象。"
-                            }
-                        ]
-                    },
-                    "iteration": 3
-                },
-                {
-                    "type": "economic_data",
-                    "data": {
-                        "china": {
-                            "import_value_billion_usd": 63.75,
-                            "import_change_pct": -15.00,
-                            "export_value_billion_usd": 325.60,
-                            "export_change_pct": -12.00,
-                            "market_share_pct": 29.61,
-                            "market_share_change_pct": -6.00,
-                            "annual_production_ten_thousand_vehicles": 864,
-                            "annual_production_change_pct": -4.00,
-                            "demand_ten_thousand_vehicles": 746.90,
-                            "demand_change_pct": -3.00,
-                            "production_cost_ten_thousand_usd": 2.25,
-                            "production_cost_change_pct": -2.00
-                        },
-                        "us": {
-                            "import_value_billion_usd": 108.00,
-                            "import_change_pct": -10.00,
-                            "export_value_billion_usd": 68.25,
-                            "export_change_pct": 5.00,
-                            "market_share_pct": 11.55,
-                            "market_share_change_pct": 10.00,
-                            "annual_production_ten_thousand_vehicles": 232.20,
-                            "annual_production_change_pct": 8.00,
-                            "demand_ten_thousand_vehicles": 142.80,
-                            "demand_change_pct": 2.00,
-                            "production_cost_ten_thousand_usd": 3.12,
-                            "production_cost_change_pct": -1.00
-                        }
-                    },
-                    "iteration": 3
-                }
-            ]
-
-        data_list2 = [
-            {"type": "iteration_start", "data": {"iteration_text": "初始响应", "initiator": "us", "content": "美国总统特朗普签署行政令，宣布：对所有贸易伙伴加征10%的关税。对与美国贸易逆差最大的国家和地区征收更高的\"对等关税\""}, "iteration": 0},
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "china",
-                            "action": "宣布对美部分商品加征反制关税",
-                            "action_detail": "中国财政部宣布对美国出口至中国的航空零部件、猪肉、葡萄酒等商品加征5%-15%的报复性关税，同时表示保留进一步扩大关税范围的权利。此举旨在对等回应美方贸易施压，并维护多边贸易秩序。"
-                        }
-                    ]
-                },
-                "iteration": 0
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "us_corp",
-                            "action": "寻求非中国供应商",
-                            "action_detail": "面对中方反制关税，美国汽车制造商和航空零部件企业开始重新评估其在中国的供应链布局，考虑转向越南、墨西哥等地采购以分散风险。"
-                        }
-                    ]
-                },
-                "iteration": 0
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "chine_corp",
-                            "action": "加强内循环与海外市场开拓",
-                            "action_detail": "中国汽车与机电企业启动“内外双轮”策略，提升国内市场占比，同时加强与东盟、拉美地区的出口合作，规避美国市场壁垒。"
-                        }
-                    ]
-                },
-                "iteration": 0
-            },
-            {
-                "type": "economic_data",
-                "data": {
-                    "china": {
-                        "import_value_billion_usd": 74.20,
-                        "import_change_pct": -6.40,
-                        "export_value_billion_usd": 368.00,
-                        "export_change_pct": -10.80,
-                        "market_share_pct": 31.10,
-                        "market_share_change_pct": -5.00,
-                        "annual_production_ten_thousand_vehicles": 890,
-                        "annual_production_change_pct": -2.50,
-                        "demand_ten_thousand_vehicles": 768.00,
-                        "demand_change_pct": -5.00,
-                        "production_cost_ten_thousand_usd": 2.35,
-                        "production_cost_change_pct": -3.00
-                    },
-                    "us": {
-                        "import_value_billion_usd": 121.50,
-                        "import_change_pct": -9.80,
-                        "export_value_billion_usd": 66.20,
-                        "export_change_pct": 7.60,
-                        "market_share_pct": 10.70,
-                        "market_share_change_pct": 11.80,
-                        "annual_production_ten_thousand_vehicles": 218.00,
-                        "annual_production_change_pct": 6.80,
-                        "demand_ten_thousand_vehicles": 141.20,
-                        "demand_change_pct": -4.50,
-                        "production_cost_ten_thousand_usd": 3.18,
-                        "production_cost_change_pct": 4.50
-                    }
-                },
-                "iteration": 0
-            },
-            {
-                "type": "iteration_start",
-                "data": {
-                    "iteration_text": "迭代 1",
-                    "initiator": "us",
-                    "content": "美国进一步宣布，对中国出口至美国的电动汽车电池组及充电模块加征25%关税，理由是“保障新能源产业核心安全”并限制对中国的战略依赖。"
-                },
-                "iteration": 1
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "us",
-                            "action": "扩大关税至新能源汽车核心部件",
-                            "action_detail": "美国贸易代表办公室表示，新增的25%关税将适用于中国出口的锂电池模组、整车电控系统与智能充电设备，目的是减少关键能源设备依赖。"
-                        }
-                    ]
-                },
-                "iteration": 1
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "china",
-                            "action": "对美高附加值产品加征报复关税",
-                            "action_detail": "中国将对进口自美国的中大型SUV整车和发动机总成征收10%-20%的附加税，并对涉及新能源设备的关键技术设备启动安全审查。"
-                        }
-                    ]
-                },
-                "iteration": 1
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "us_corp",
-                            "action": "加快墨西哥电池厂投产计划",
-                            "action_detail": "为降低对华进口依赖，通用与LG能源合资电池厂在墨西哥的投产时程将提前半年，专供北美电动车产线。"
-                        }
-                    ]
-                },
-                "iteration": 1
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "chine_corp",
-                            "action": "加速开拓南美与中东市场",
-                            "action_detail": "比亚迪与巴西、沙特合作建立装配工厂，作为替代出口战略的关键节点，并同步布局售后服务网络。"
-                        }
-                    ]
-                },
-                "iteration": 1
-            },
-            {
-                "type": "economic_data",
-                "data": {
-                    "china": {
-                        "import_value_billion_usd": 67.50,
-                        "import_change_pct": -8.80,
-                        "export_value_billion_usd": 345.00,
-                        "export_change_pct": -6.25,
-                        "market_share_pct": 29.80,
-                        "market_share_change_pct": -4.20,
-                        "annual_production_ten_thousand_vehicles": 872,
-                        "annual_production_change_pct": -2.02,
-                        "demand_ten_thousand_vehicles": 745.00,
-                        "demand_change_pct": -3.00,
-                        "production_cost_ten_thousand_usd": 2.38,
-                        "production_cost_change_pct": 1.28
-                    },
-                    "us": {
-                        "import_value_billion_usd": 112.80,
-                        "import_change_pct": -7.20,
-                        "export_value_billion_usd": 69.80,
-                        "export_change_pct": 5.43,
-                        "market_share_pct": 11.30,
-                        "market_share_change_pct": 5.61,
-                        "annual_production_ten_thousand_vehicles": 226.50,
-                        "annual_production_change_pct": 3.87,
-                        "demand_ten_thousand_vehicles": 143.00,
-                        "demand_change_pct": 1.27,
-                        "production_cost_ten_thousand_usd": 3.22,
-                        "production_cost_change_pct": 1.26
-                    }
-                },
-                "iteration": 1
-            },
-            {
-                "type": "iteration_start",
-                "data": {
-                    "iteration_text": "迭代 2",
-                    "initiator": "china",
-                    "content": "中国商务部发布声明，呼吁中美恢复高层经贸对话，并表示如美方释放善意，中方将考虑在关税与投资审查方面适度调整。"
-                },
-                "iteration": 2
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "china",
-                            "action": "呼吁重启对话并释放谈判信号",
-                            "action_detail": "中国商务部提出建立“中美绿色产业工作组”建议，并宣布暂停对部分美系车企技术设备进口的安全审查程序，释放缓和信号。"
-                        }
-                    ]
-                },
-                "iteration": 2
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "us",
-                            "action": "回应谨慎，并强调结构性改革诉求",
-                            "action_detail": "美国财政部表示愿就新能源汽车补贴与市场准入进行接触性对话，但强调中方需在知识产权与补贴透明度上作出“实质性承诺”。"
-                        }
-                    ]
-                },
-                "iteration": 2
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "us_corp",
-                            "action": "呼吁政府明确长期政策方向",
-                            "action_detail": "美国产业联盟联合声明，支持中美开展绿色产业对话，认为建立清晰、可预期的出口监管机制将有助于企业制定中长期投资决策。"
-                        }
-                    ]
-                },
-                "iteration": 2
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "chine_corp",
-                            "action": "对接国际标准以缓解贸易摩擦",
-                            "action_detail": "宁德时代宣布将核心动力电池产品全面对标欧盟REACH与美方UL标准，助力产品“认证出海”，并提升全球供应链可信度。"
-                        }
-                    ]
-                },
-                "iteration": 2
-            },
-            {
-                "type": "economic_data",
-                "data": {
-                    "china": {
-                        "import_value_billion_usd": 68.40,
-                        "import_change_pct": 1.33,
-                        "export_value_billion_usd": 347.80,
-                        "export_change_pct": 0.81,
-                        "market_share_pct": 30.10,
-                        "market_share_change_pct": 1.00,
-                        "annual_production_ten_thousand_vehicles": 878,
-                        "annual_production_change_pct": 0.69,
-                        "demand_ten_thousand_vehicles": 752.50,
-                        "demand_change_pct": 1.01,
-                        "production_cost_ten_thousand_usd": 2.30,
-                        "production_cost_change_pct": -3.36
-                    },
-                    "us": {
-                        "import_value_billion_usd": 115.00,
-                        "import_change_pct": 1.95,
-                        "export_value_billion_usd": 70.90,
-                        "export_change_pct": 1.58,
-                        "market_share_pct": 11.50,
-                        "market_share_change_pct": 1.77,
-                        "annual_production_ten_thousand_vehicles": 229.20,
-                        "annual_production_change_pct": 1.19,
-                        "demand_ten_thousand_vehicles": 144.00,
-                        "demand_change_pct": 0.70,
-                        "production_cost_ten_thousand_usd": 3.16,
-                        "production_cost_change_pct": -1.86
-                    }
-                },
-                "iteration": 2
-            },
-            {
-                "type": "iteration_start",
-                "data": {
-                    "iteration_text": "迭代 3",
-                    "initiator": "us",
-                    "content": "美国贸易代表办公室公布与中国就新能源汽车领域的谈判进展，并宣布暂停部分新增关税，同时设立“中美绿色科技联合评估组”。"
-                },
-                "iteration": 3
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "us",
-                            "action": "暂停关税并启动评估机制",
-                            "action_detail": "美国决定暂缓对新增电控设备与高功率充电器的25%关税实施，并将与中国设立联合评估组，定期交流绿色科技补贴、市场准入等议题。"
-                        }
-                    ]
-                },
-                "iteration": 3
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "china",
-                            "action": "降低对美关键零部件关税",
-                            "action_detail": "中国财政部宣布自下季度起，部分美国产新能源汽车零部件关税税率从15%下调至10%，以回应美方释放的谈判诚意。"
-                        }
-                    ]
-                },
-                "iteration": 3
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "us_corp",
-                            "action": "重启对华合作项目评估",
-                            "action_detail": "美国部分新能源汽车企业开始重启中止中的技术授权与合资谈判，主要聚焦电池技术、智能驾驶系统等低敏感度领域。"
-                        }
-                    ]
-                },
-                "iteration": 3
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "chine_corp",
-                            "action": "推进海外IPO与战略合作",
-                            "action_detail": "小鹏汽车与理想汽车宣布计划赴港二次上市，融资资金将主要用于欧洲产能扩张及与当地运营商的战略联盟。"
-                        }
-                    ]
-                },
-                "iteration": 3
-            },
-            {
-                "type": "economic_data",
-                "data": {
-                    "china": {
-                        "import_value_billion_usd": 70.10,
-                        "import_change_pct": 2.49,
-                        "export_value_billion_usd": 353.80,
-                        "export_change_pct": 1.72,
-                        "market_share_pct": 30.90,
-                        "market_share_change_pct": 2.66,
-                        "annual_production_ten_thousand_vehicles": 886,
-                        "annual_production_change_pct": 0.91,
-                        "demand_ten_thousand_vehicles": 760.00,
-                        "demand_change_pct": 1.00,
-                        "production_cost_ten_thousand_usd": 2.27,
-                        "production_cost_change_pct": -1.30
-                    },
-                    "us": {
-                        "import_value_billion_usd": 117.80,
-                        "import_change_pct": 2.43,
-                        "export_value_billion_usd": 72.40,
-                        "export_change_pct": 2.11,
-                        "market_share_pct": 11.85,
-                        "market_share_change_pct": 3.04,
-                        "annual_production_ten_thousand_vehicles": 232.80,
-                        "annual_production_change_pct": 1.57,
-                        "demand_ten_thousand_vehicles": 146.20,
-                        "demand_change_pct": 1.53,
-                        "production_cost_ten_thousand_usd": 3.08,
-                        "production_cost_change_pct": -2.53
-                    }
-                },
-                "iteration": 3
-            }
-        ]
-
-        data_list3 = [
-            {"type": "iteration_start", "data": {"iteration_text": "初始响应", "initiator": "us", "content": "美国总统特朗普签署行政令，宣布：对所有贸易伙伴加征10%的关税。对与美国贸易逆差最大的国家和地区征收更高的\"对等关税\""}, "iteration": 0},
-            {
-                "type": "iteration_start",
-                "data": {
-                    "iteration_text": "迭代 1",
-                    "initiator": "china",
-                    "content": "中国宣布对包括大豆、飞机零部件、半导体设备在内的500亿美元美国商品加征最高10%关税，并中止对部分美企的采购合作。"
-                },
-                "iteration": 1
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "us",
-                            "action": "扩大征税面并审查中国在美资产",
-                            "action_detail": "白宫宣布对中国电子产品、新能源设备等追加25%关税，并授权财政部全面审查中国国企及投资基金在美投资项目与资产配置。"
-                        }
-                    ]
-                },
-                "iteration": 1
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "us_corp",
-                            "action": "加速撤离中国",
-                            "action_detail": "多家在华美企（包括苹果代工厂、特斯拉配套商）启动“去中国化”计划，拟将产线转向印度、东南亚以规避政策风险。"
-                        }
-                    ]
-                },
-                "iteration": 1
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "chine_corp",
-                            "action": "配合国家战略构建“内循环”体系",
-                            "action_detail": "华为、比亚迪等企业宣布实施“双自主”战略，在全国建立备份供应链体系并优先服务国内市场，以保障自主安全。"
-                        }
-                    ]
-                },
-                "iteration": 1
-            },
-            {
-                "type": "economic_data",
-                "data": {
-                    "china": {
-                        "import_value_billion_usd": 62.00,
-                        "import_change_pct": -17.30,
-                        "export_value_billion_usd": 320.00,
-                        "export_change_pct": -13.50,
-                        "market_share_pct": 28.00,
-                        "market_share_change_pct": -7.00,
-                        "annual_production_ten_thousand_vehicles": 845,
-                        "annual_production_change_pct": -6.10,
-                        "demand_ten_thousand_vehicles": 702.00,
-                        "demand_change_pct": -7.30,
-                        "production_cost_ten_thousand_usd": 2.45,
-                        "production_cost_change_pct": 3.50
-                    },
-                    "us": {
-                        "import_value_billion_usd": 92.00,
-                        "import_change_pct": -23.30,
-                        "export_value_billion_usd": 60.00,
-                        "export_change_pct": -7.70,
-                        "market_share_pct": 10.20,
-                        "market_share_change_pct": -4.80,
-                        "annual_production_ten_thousand_vehicles": 210.00,
-                        "annual_production_change_pct": -5.00,
-                        "demand_ten_thousand_vehicles": 135.00,
-                        "demand_change_pct": -3.60,
-                        "production_cost_ten_thousand_usd": 3.38,
-                        "production_cost_change_pct": 6.80
-                    }
-                },
-                "iteration": 1
-            },
-            {
-                "type": "iteration_start",
-                "data": {
-                    "iteration_text": "迭代 2",
-                    "initiator": "us",
-                    "content": "美国联合欧盟、日本、加拿大发表联合声明，宣布建立‘民主技术联盟’，共同限制对华高端芯片、自动驾驶、量子计算产品出口，并冻结部分中资企业在西方国家的银行账户。"
-                },
-                "iteration": 2
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "us",
-                            "action": "联合盟友组建‘民主技术联盟’",
-                            "action_detail": "美、欧、日、加共同实施对华出口禁令，涵盖先进芯片、车载操作系统、工业仿真软件，并同步冻结华为、中兴、比亚迪在欧美的银行账户，限制其跨境资金流动。"
-                        }
-                    ]
-                },
-                "iteration": 2
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "china",
-                            "action": "推动数字人民币国际化与支付脱钩",
-                            "action_detail": "中国人民银行宣布与多国央行开展数字人民币跨境结算试点，推动与东盟、非洲、俄罗斯等国家建立独立于SWIFT体系的清算网络。"
-                        }
-                    ]
-                },
-                "iteration": 2
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "us_corp",
-                            "action": "遭遇中国市场舆论与政策封锁",
-                            "action_detail": "苹果、波音、耐克等美国品牌在中国遭遇消费者大规模抵制，多地政府采购排除美企产品，营收锐减超40%，资本市场信心动摇。"
-                        }
-                    ]
-                },
-                "iteration": 2
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "chine_corp",
-                            "action": "推动人民币结算系统走向拉美与非洲",
-                            "action_detail": "中国出口型龙头企业与巴西、南非、阿联酋等国签署以人民币计价的大宗贸易协议，并推动在当地建设人民币清算中心。"
-                        }
-                    ]
-                },
-                "iteration": 2
-            },
-            {
-                "type": "economic_data",
-                "data": {
-                    "china": {
-                        "import_value_billion_usd": 58.00,
-                        "import_change_pct": -25.80,
-                        "export_value_billion_usd": 298.50,
-                        "export_change_pct": -21.70,
-                        "market_share_pct": 25.80,
-                        "market_share_change_pct": -8.00,
-                        "annual_production_ten_thousand_vehicles": 810,
-                        "annual_production_change_pct": -8.20,
-                        "demand_ten_thousand_vehicles": 690.00,
-                        "demand_change_pct": -9.70,
-                        "production_cost_ten_thousand_usd": 2.60,
-                        "production_cost_change_pct": 6.40
-                    },
-                    "us": {
-                        "import_value_billion_usd": 85.00,
-                        "import_change_pct": -30.00,
-                        "export_value_billion_usd": 56.20,
-                        "export_change_pct": -9.10,
-                        "market_share_pct": 9.80,
-                        "market_share_change_pct": -6.40,
-                        "annual_production_ten_thousand_vehicles": 205.00,
-                        "annual_production_change_pct": -6.20,
-                        "demand_ten_thousand_vehicles": 132.50,
-                        "demand_change_pct": -5.00,
-                        "production_cost_ten_thousand_usd": 3.52,
-                        "production_cost_change_pct": 8.20
-                    }
-                },
-                "iteration": 2
-            },
-            {
-                "type": "iteration_start",
-                "data": {
-                    "iteration_text": "迭代 3",
-                    "initiator": "china",
-                    "content": "中国宣布将重要信息基础设施全面迁出美系技术体系，实施‘网络安全白名单’制度，逐步推进数字生态去美元化。"
-                },
-                "iteration": 3
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "china",
-                            "action": "建立‘信息安全白名单’，加速网络脱钩",
-                            "action_detail": "中国国家网信办发布新规，所有政企核心系统必须使用国产芯片、操作系统与数据库，全面停用美系云服务与安全协议接口，并限制对美元支付接口的依赖。"
-                        }
-                    ]
-                },
-                "iteration": 3
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "us",
-                            "action": "冻结中资企业美元结算通道",
-                            "action_detail": "美国财政部发布紧急指令，暂停所有涉及特定中资科技与汽车企业的美元跨境结算服务，并对五家大型中资银行进行审计追责。"
-                        }
-                    ]
-                },
-                "iteration": 3
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "us_corp",
-                            "action": "被排除于中国网络与支付系统之外",
-                            "action_detail": "谷歌、亚马逊AWS、英伟达等被中国列入信息安全限制清单，原有合作终止，云服务与AI芯片业务全面冻结，资本市场预期大跌。"
-                        }
-                    ]
-                },
-                "iteration": 3
-            },
-            {
-                "type": "agent_announce",
-                "data": {
-                    "agents": [
-                        {
-                            "agent": "chine_corp",
-                            "action": "加速构建人民币计价、国密通信的企业闭环",
-                            "action_detail": "中国头部科技与车企全面部署国产操作系统与‘国密算法’通信标准，建立境内闭环ERP与供应链金融体系，实现关键业务对美脱钩。"
-                        }
-                    ]
-                },
-                "iteration": 3
-            },
-            {
-                "type": "economic_data",
-                "data": {
-                    "china": {
-                        "import_value_billion_usd": 52.80,
-                        "import_change_pct": -31.03,
-                        "export_value_billion_usd": 281.00,
-                        "export_change_pct": -29.00,
-                        "market_share_pct": 24.50,
-                        "market_share_change_pct": -5.00,
-                        "annual_production_ten_thousand_vehicles": 788,
-                        "annual_production_change_pct": -6.80,
-                        "demand_ten_thousand_vehicles": 676.00,
-                        "demand_change_pct": -4.90,
-                        "production_cost_ten_thousand_usd": 2.72,
-                        "production_cost_change_pct": 4.62
-                    },
-                    "us": {
-                        "import_value_billion_usd": 80.00,
-                        "import_change_pct": -28.57,
-                        "export_value_billion_usd": 52.00,
-                        "export_change_pct": -7.45,
-                        "market_share_pct": 9.30,
-                        "market_share_change_pct": -5.10,
-                        "annual_production_ten_thousand_vehicles": 198.00,
-                        "annual_production_change_pct": -3.40,
-                        "demand_ten_thousand_vehicles": 129.00,
-                        "demand_change_pct": -2.60,
-                        "production_cost_ten_thousand_usd": 3.61,
-                        "production_cost_change_pct": 2.56
-                    }
-                },
-                "iteration": 3
-            }
-        ]
-
-        global iteration
-
-        data_list = data_list1 if iteration == 1 else data_list2 if iteration == 2 else data_list3
-
-        for data in data_list:
+
+async def fake_start(run_id: Optional[str] = None, speed: float = REPLAY["speed"],
+                     from_iteration: int = 0) -> StreamingResponse:
+    """回放已录制的运行，不调用LLM
+
+    未指定run_id时依次轮换trace目录中的运行；speed为回放速度倍率（1为原始节奏，0为不等待），
+    from_iteration可直接跳到指定迭代
+    """
+    if run_id is None:
+        run_ids = trace_store.run_ids()
+        if not run_ids:
+            raise HTTPException(status_code=404, detail="No trace recorded")
+        run_id = run_ids[next(_replay_counter) % len(run_ids)]
+    elif run_id not in trace_store.run_ids():
+        raise HTTPException(status_code=404, detail=f"Trace {run_id} not found")
+
+    async def iterator() -> AsyncIterable[str]:
+        async for data in trace_store.replay(run_id, speed=speed, from_iteration=from_iteration):
             yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
-            await asyncio.sleep(5)
 
-        iteration += 1
-        if iteration > 3:
-            iteration = 1
+    return StreamingResponse(
+        iterator(),
+        media_type="text/event-stream",
+    )
+
+
+def _require_run_store() -> RunStore:
+    if run_store is None:
+        raise HTTPException(status_code=404, detail="Run store is disabled")
+    return run_store
+
+
+async def list_runs(limit: int = 50, offset: int = 0) -> List[Dict]:
+    """按开始时间倒序列出已保存的运行"""
+    return await asyncio.to_thread(_require_run_store().list_runs, limit, offset)
+
+
+async def get_run(run_id: str, iteration: Optional[int] = None) -> Dict:
+    """获取一次运行及其事件，可只取某一迭代的事件"""
+    store = _require_run_store()
+    run = await asyncio.to_thread(store.get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found")
+    run["events"] = await asyncio.to_thread(store.events, run_id, iteration)
+    return run
+
+
+async def query_events(since: Optional[float] = None, until: Optional[float] = None,
+                       run_id: Optional[str] = None, limit: int = 1000) -> List[Dict]:
+    """按时间范围（unix时间戳）查询事件，可限定运行"""
+    store = _require_run_store()
+    return await asyncio.to_thread(store.events, run_id, None, since, until, limit)
+
+
+async def create_simulation(stream: bool = STREAM_AGENT_OUTPUT, turn_mode: str = AGENT_TURN_MODE,
+                            context_mode: str = CONTEXT_UPDATE_MODE) -> JSONResponse:
+    """提交一次后台模拟，立即返回模拟id，事件通过/simulations/{id}/events订阅"""
+    drain_state.check_accepting()
+    _check_context_mode(context_mode)
+    session = agent_pool.create_session(context, streaming=stream, turn_mode=turn_mode, context_mode=context_mode)
+    try:
+        job = job_manager.submit(session, _run_events)
+    except JobPoolSaturated as e:
+        session.close()
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    if run_store is not None:
+        run_store.begin(session.run_id, {"stream": stream, "turn_mode": turn_mode, "context_mode": context_mode})
+    return JSONResponse(
+        {**job.info(), "events_url": f"/simulations/{job.id}/events"},
+        status_code=202,
+    )
+
+
+def _stored_events_stream(run_id: str, after: Optional[int], poll: float = 1.0) -> StreamingResponse:
+    """以SSE推送运行记录中的事件，运行仍在其他进程中进行时轮询新事件，直到运行结束
+
+    超过retention秒没有新事件时视为原进程已退出，不再等待
+    """
+    async def iterator() -> AsyncIterable[str]:
+        yield "retry: 3000\n\n"
+        last_seq = after
+        last_event = last_ping = time.monotonic()
+        while True:
+            run = await asyncio.to_thread(run_store.get_run, run_id)
+            events = await asyncio.to_thread(run_store.events, run_id, None, None, None, 10000, last_seq)
+            for event in events:
+                last_seq = event["seq"]
+                data = {key: event[key] for key in ("type", "data", "iteration")}
+                yield f"id: {last_seq}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+            now = time.monotonic()
+            if events:
+                last_event = last_ping = now
+                continue
+            if run is None or run["status"] != "running" or now - last_event > SIMULATION_JOBS["retention"]:
+                return
+            if now - last_ping >= SIMULATION_JOBS["heartbeat"]:
+                last_ping = now
+                yield ": ping\n\n"
+            await asyncio.sleep(poll)
 
     return StreamingResponse(
         iterator(),
         media_type="text/event-stream",
     )
-    
 
-#
-# if __name__ == "__main__":
-#     asyncio.run(start())
\ No newline at end of file
+
+def _require_job(simulation_id: str):
+    job = job_manager.get(simulation_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Simulation {simulation_id} not found")
+    return job
+
+
+async def get_simulation(simulation_id: str) -> Dict:
+    return _require_job(simulation_id).info()
+
+
+async def cancel_simulation(simulation_id: str) -> Dict:
+    """中止一次后台模拟，已完成的迭代保留检查点"""
+    job = _require_job(simulation_id)
+    job_manager.cancel(simulation_id)
+    return job.info()
+
+
+async def simulation_events(simulation_id: str, last_event_id: Optional[str] = Header(None),
+                            after: Optional[int] = None) -> StreamingResponse:
+    """订阅后台模拟的事件
+
+    每条事件带有id，断线重连时客户端携带Last-Event-ID（或after参数）即可从下一条继续；
+    客户端断开不影响模拟运行；模拟不在本进程内存中时（如重启或端口交接后）从运行记录读取
+    """
+    if after is None and last_event_id is not None:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    job = job_manager.get(simulation_id)
+    if job is None:
+        if run_store is None or await asyncio.to_thread(run_store.get_run, simulation_id) is None:
+            raise HTTPException(status_code=404, detail=f"Simulation {simulation_id} not found")
+        return _stored_events_stream(simulation_id, after)
+
+    async def history(start_id: int, end_id: int) -> List[Dict]:
+        # 超出内存缓冲的旧事件从运行记录中读取
+        if run_store is None:
+            return []
+        await asyncio.to_thread(run_store.flush)
+        # 只查询缺失的区间，长运行重连时不必读取全部事件
+        events = await asyncio.to_thread(run_store.events, simulation_id, None, None, None,
+                                         max(end_id - start_id, 0), start_id - 1)
+        return [{key: event[key] for key in ("type", "data", "iteration")}
+                for event in events if event["seq"] < end_id]
+
+    async def iterator() -> AsyncIterable[str]:
+        yield "retry: 3000\n\n"
+        async for item in job.subscribe(after, heartbeat=SIMULATION_JOBS["heartbeat"], history=history):
+            if item is None:
+                yield ": ping\n\n"
+                continue
+            event_id, data = item
+            yield f"id: {event_id}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        iterator(),
+        media_type="text/event-stream",
+    )
@@ -0,0 +1,218 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    status TEXT NOT NULL,
+    options TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    iteration INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    ts REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_events_run_seq ON events (run_id, seq);
+CREATE INDEX IF NOT EXISTS idx_events_run_iteration ON events (run_id, iteration);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS idx_runs_started ON runs (started_at);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    run_id TEXT NOT NULL,
+    iteration INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (run_id, iteration)
+);
+"""
+
+
+class RunStore:
+    """运行结果的SQLite存储
+
+    写入只把记录放进队列，由后台线程按批（batch_size条或flush_interval秒）在一个事务中提交，
+    不阻塞事件循环；读取在调用方线程中使用独立连接，可配合asyncio.to_thread使用
+    """
+
+    def __init__(self, path: str, batch_size: int = 100, flush_interval: float = 0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+        self._queue: queue.Queue = queue.Queue()
+        self._seq: Dict[str, int] = {}
+        self._writer = threading.Thread(target=self._write_loop, name="run-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ---- 写入 ----
+
+    def begin(self, run_id: str, options: Optional[Dict] = None) -> None:
+        self._seq[run_id] = 0
+        self._queue.put(("INSERT OR REPLACE INTO runs (run_id, started_at, status, options) VALUES (?, ?, ?, ?)",
+                         (run_id, time.time(), "running", json.dumps(options or {}, ensure_ascii=False))))
+
+    def append(self, run_id: str, event: Dict) -> None:
+        """追加一条运行事件，seq为该运行内的事件序号"""
+        seq = self._seq.get(run_id, 0)
+        self._seq[run_id] = seq + 1
+        self._queue.put(("INSERT INTO events (run_id, seq, iteration, type, ts, data) VALUES (?, ?, ?, ?, ?, ?)",
+                         (run_id, seq, event.get("iteration", 0), event.get("type", ""), time.time(),
+                          json.dumps(event.get("data"), ensure_ascii=False))))
+
+    def finish(self, run_id: str, status: str) -> None:
+        """标记运行结束，status为completed/aborted"""
+        self._seq.pop(run_id, None)
+        self._queue.put(("UPDATE runs SET ended_at = ?, status = ? WHERE run_id = ?", (time.time(), status, run_id)))
+
+    def save_checkpoint(self, run_id: str, iteration: int, state: Dict) -> None:
+        """保存运行在第iteration轮开始前的状态，状态在调用时即序列化"""
+        self._queue.put(("INSERT OR REPLACE INTO checkpoints (run_id, iteration, ts, state) VALUES (?, ?, ?, ?)",
+                         (run_id, iteration, time.time(), json.dumps(state, ensure_ascii=False))))
+
+    def reopen(self, run_id: str, from_iteration: int) -> None:
+        """恢复运行前调用（阻塞，应在线程中执行）：删除未完成迭代的事件，事件序号接续原有记录"""
+        self.flush()
+        with self._connect() as conn:
+            last_seq = conn.execute("SELECT MAX(seq) FROM events WHERE run_id = ?", (run_id,)).fetchone()[0]
+        self._seq[run_id] = last_seq + 1 if last_seq is not None else 0
+        self._queue.put(("DELETE FROM events WHERE run_id = ? AND iteration >= ?", (run_id, from_iteration)))
+        self._queue.put(("UPDATE runs SET status = ?, ended_at = NULL WHERE run_id = ?", ("running", run_id)))
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """等待已入队的记录全部写入"""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self) -> None:
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            batch, waiters = [], []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stopping or waiters or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    with conn:
+                        for sql, params in batch:
+                            conn.execute(sql, params)
+                except sqlite3.Error:
+                    # 整批已回滚，逐条重试，只丢弃失败的记录（如交接期间新旧进程写入同一seq）
+                    self._write_rows(conn, batch)
+            for waiter in waiters:
+                waiter.set()
+        conn.close()
+
+    @staticmethod
+    def _write_rows(conn: sqlite3.Connection, batch: List[Tuple[str, Tuple]]) -> None:
+        failed = 0
+        for sql, params in batch:
+            try:
+                with conn:
+                    conn.execute(sql, params)
+            except sqlite3.Error as e:
+                failed += 1
+                print(f"警告: 运行记录写入失败，丢弃该条: {e}")
+        if failed:
+            print(f"警告: 本批{len(batch)}条记录中{failed}条写入失败")
+
+    # ---- 读取 ----
+
+    def list_runs(self, limit: int = 50, offset: int = 0) -> List[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT run_id, started_at, ended_at, status, options FROM runs ORDER BY started_at DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        return [{**dict(row), "options": json.loads(row["options"] or "{}")} for row in rows]
+
+    def get_run(self, run_id: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT run_id, started_at, ended_at, status, options FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {**dict(row), "options": json.loads(row["options"] or "{}")}
+
+    def latest_checkpoint(self, run_id: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT state FROM checkpoints WHERE run_id = ? ORDER BY iteration DESC LIMIT 1", (run_id,)
+            ).fetchone()
+        return json.loads(row["state"]) if row is not None else None
+
+    def events(self, run_id: Optional[str] = None, iteration: Optional[int] = None,
+               since: Optional[float] = None, until: Optional[float] = None, limit: int = 10000,
+               after_seq: Optional[int] = None) -> List[Dict]:
+        """按运行、迭代或时间范围（unix时间戳）查询事件，返回与SSE推送相同结构的事件，after_seq只取序号更大的事件"""
+        conditions, params = [], []
+        if run_id is not None:
+            conditions.append("run_id = ?")
+            params.append(run_id)
+        if after_seq is not None:
+            conditions.append("seq > ?")
+            params.append(after_seq)
+        if iteration is not None:
+            conditions.append("iteration = ?")
+            params.append(iteration)
+        if since is not None:
+            conditions.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("ts < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = "seq" if run_id is not None else "ts, seq"
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT run_id, seq, iteration, type, ts, data FROM events {where} ORDER BY {order} LIMIT ?",
+                (*params, limit)
+            ).fetchall()
+        return [{
+            "type": row["type"],
+            "data": json.loads(row["data"]),
+            "iteration": row["iteration"],
+            "run_id": row["run_id"],
+            "seq": row["seq"],
+            "ts": row["ts"],
+        } for row in rows]
@@ -1,9 +1,10 @@
 import json
 import json_repair
 
-from langchain_openai import ChatOpenAI
-from typing import Any
-from configs.model_config import llm_model
+from typing import Any, Dict, List, Optional, Tuple
+from configs.model_config import llm_model, LLM_CACHE, LLM_SINGLE_FLIGHT, LLM_HTTP_CLIENT, LLM_ROUTING, LLM_DEADLINES, LLM_HEDGING
+from server.llm import LLMCache, ModelRegistry, SimChatModel, SingleFlight
+from server.llm.tokens import estimate_tokens, truncate_tokens
 
 def extract_pure_json(info: str):
     """gpt返回的字符串可能不带前缀，也可能带前缀"""
@@ -13,29 +14,209 @@ def extract_pure_json(info: str):
     except Exception as e:
             return {}
 
+
+def extract_usage(message) -> Dict[str, int]:
+    """从模型返回的消息中提取token用量，cached_tokens为命中服务商前缀缓存的输入token数"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+    if not cached:
+        # DeepSeek在token_usage中单独返回prompt_cache_hit_tokens
+        token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+        cached = token_usage.get("prompt_cache_hit_tokens") or 0
+    return {
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "cached_tokens": cached,
+    }
+
+
+_JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class IncrementalJsonReader:
+    """增量读取流式输出中的JSON对象
+
+    只解析顶层字段：字符串字段在生成过程中以增量形式返回，
+    字段值完整后写入values，忽略对象前后的```json等前缀
+    """
+
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        self._state = "seek"
+        self._key = None
+        self._buf: List[str] = []
+        self._escape = None
+        self._high_surrogate = None
+        self._nested_depth = 0
+        self._nested_in_str = False
+        self._nested_escape = False
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """读入一段文本，返回本段中各字符串字段新增的(字段名, 文本)"""
+        deltas: List[Tuple[str, str]] = []
+        for ch in chunk:
+            state = self._state
+            if state == "seek":
+                if ch == "{":
+                    self._state = "key"
+            elif state == "key":
+                if ch == '"':
+                    self._buf = []
+                    self._state = "key_str"
+                elif ch == "}":
+                    self._state = "done"
+            elif state == "key_str":
+                decoded, closed = self._read_str(ch)
+                if closed:
+                    self._key = "".join(self._buf)
+                    self._state = "colon"
+                elif decoded:
+                    self._buf.append(decoded)
+            elif state == "colon":
+                if ch == ":":
+                    self._state = "value"
+            elif state == "value":
+                if ch.isspace():
+                    continue
+                self._buf = []
+                if ch == '"':
+                    self._state = "value_str"
+                elif ch in "{[":
+                    self._buf.append(ch)
+                    self._nested_depth = 1
+                    self._nested_in_str = False
+                    self._nested_escape = False
+                    self._state = "nested"
+                else:
+                    self._buf.append(ch)
+                    self._state = "scalar"
+            elif state == "value_str":
+                decoded, closed = self._read_str(ch)
+                if closed:
+                    self.values[self._key] = "".join(self._buf)
+                    self._state = "key"
+                elif decoded:
+                    self._buf.append(decoded)
+                    if deltas and deltas[-1][0] == self._key:
+                        deltas[-1] = (self._key, deltas[-1][1] + decoded)
+                    else:
+                        deltas.append((self._key, decoded))
+            elif state == "scalar":
+                if ch in ",}" or ch.isspace():
+                    raw = "".join(self._buf)
+                    try:
+                        self.values[self._key] = json.loads(raw)
+                    except ValueError:
+                        self.values[self._key] = raw
+                    self._state = "done" if ch == "}" else "key"
+                else:
+                    self._buf.append(ch)
+            elif state == "nested":
+                self._buf.append(ch)
+                if self._nested_in_str:
+                    if self._nested_escape:
+                        self._nested_escape = False
+                    elif ch == "\\":
+                        self._nested_escape = True
+                    elif ch == '"':
+                        self._nested_in_str = False
+                elif ch == '"':
+                    self._nested_in_str = True
+                elif ch in "{[":
+                    self._nested_depth += 1
+                elif ch in "}]":
+                    self._nested_depth -= 1
+                    if self._nested_depth == 0:
+                        self.values[self._key] = extract_pure_json("".join(self._buf))
+                        self._state = "key"
+        return deltas
+
+    def _read_str(self, ch: str) -> Tuple[str, bool]:
+        """读取字符串中的一个字符，返回(解码后的文本, 字符串是否结束)"""
+        if self._escape is not None:
+            if self._escape == "":
+                if ch == "u":
+                    self._escape = "u"
+                    return "", False
+                self._escape = None
+                return _JSON_ESCAPES.get(ch, ch), False
+            self._escape += ch
+            if len(self._escape) < 5:
+                return "", False
+            code = int(self._escape[1:], 16) if all(c in "0123456789abcdefABCDEF" for c in self._escape[1:]) else 0xFFFD
+            self._escape = None
+            # 代理对需要与下一个\u转义合并为一个字符
+            if 0xD800 <= code <= 0xDBFF:
+                self._high_surrogate = code
+                return "", False
+            if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+                code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+                self._high_surrogate = None
+                return chr(code), False
+            return chr(code), False
+        if ch == "\\":
+            self._escape = ""
+            return "", False
+        if ch == '"':
+            return "", True
+        return ch, False
+
+
+_llm_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """获取进程内共享的LLM响应缓存，未开启时返回None"""
+    global _llm_cache
+    if _llm_cache is None and LLM_CACHE.get("enabled"):
+        _llm_cache = LLMCache(
+            max_entries=LLM_CACHE.get("max_entries", 512),
+            ttl=LLM_CACHE.get("ttl", 7 * 24 * 3600),
+            disk_dir=LLM_CACHE.get("disk_dir") or None,
+            disk_max_entries=LLM_CACHE.get("disk_max_entries", 10000),
+        )
+    return _llm_cache
+
+
+# 进程内共享的在途请求合并器
+single_flight: Optional[SingleFlight] = SingleFlight() if LLM_SINGLE_FLIGHT else None
+
+
+# 进程内共享的模型注册表，相同模型与参数复用同一实例，所有实例共用一个HTTP连接池
+model_registry = ModelRegistry(
+    llm_model,
+    http_config=LLM_HTTP_CLIENT,
+    response_cache=get_llm_cache(),
+    flights=single_flight,
+    routing_config=LLM_ROUTING,
+    deadlines=LLM_DEADLINES,
+    hedging_config=LLM_HEDGING,
+)
+
+
 def get_ChatOpenAI(
         model_name: str,
         temperature: float = 0.6,
         max_tokens: int = 1024*8,
         streaming: bool = False,
         verbose: bool = True,
+        role: Optional[str] = None,
         **kwargs: Any,
-) -> ChatOpenAI:
-    config = llm_model.get(model_name, {})
-    if not config:
-        raise ValueError(f"Model {model_name} not found")
-    model_name = config.get("model_name")
-    model = ChatOpenAI(
-        streaming=streaming,
-        verbose=verbose,
-        openai_api_key=config.get("api_key", ""),
-        openai_api_base=config.get("api_base_url", ""),
-        model_name=model_name,
+) -> SimChatModel:
+    """获取共享的模型实例，role对应LLM_DEADLINES中的调用角色"""
+    return model_registry.get(
+        model_name,
         temperature=temperature,
         max_tokens=max_tokens,
+        streaming=streaming,
+        verbose=verbose,
+        role=role,
         **kwargs
     )
-    return model
 
 
 if __name__ == "__main__":
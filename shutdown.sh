@@ -1,11 +1,28 @@
 PORT=6010
+# 等待排空的最长时间（秒），应不小于startup.py的--drain-timeout
+DRAIN_WAIT=660
 
 PID=$(lsof -i :$PORT -sTCP:LISTEN -t)
 
 if [ -n "$PID" ]; then
-    echo "找到监听 $PORT 的进程 PID: $PID，正在终止..."
-    kill $PID
+    echo "找到监听 $PORT 的进程 PID: $PID，正在排空..."
+    # SIGTERM触发排空：拒绝新的模拟，运行中的模拟继续推送直到结束或超时
+    kill -TERM $PID
+    for i in $(seq 1 $DRAIN_WAIT); do
+        ALIVE=""
+        for P in $PID; do
+            kill -0 $P 2>/dev/null && ALIVE=1
+        done
+        [ -z "$ALIVE" ] && break
+        sleep 1
+    done
+    for P in $PID; do
+        if kill -0 $P 2>/dev/null; then
+            echo "进程 $P 排空超时，强制终止。"
+            kill -9 $P
+        fi
+    done
     echo "进程 $PID 已终止。"
 else
     echo "未找到监听端口 $PORT 的进程。"
-fi
\ No newline at end of file
+fi
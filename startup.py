@@ -1,11 +1,57 @@
+import argparse
+import socket
+
 import uvicorn
 
 from server.api import app
+from server.lifecycle import drain_state
 from configs import API_SERVER
 
 
+class DrainingServer(uvicorn.Server):
+    """收到退出信号时先进入排空状态，再按uvicorn的流程停止监听并等待已有连接结束"""
+
+    def handle_exit(self, sig, frame) -> None:
+        drain_state.begin()
+        super().handle_exit(sig, frame)
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """以SO_REUSEPORT绑定端口，允许新旧进程同时监听"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
+
 if __name__ == "__main__":
-    host = API_SERVER["host"]
-    port = API_SERVER["port"]
+    parser = argparse.ArgumentParser(description="启动API服务")
+    parser.add_argument("--all-api", action="store_true", help="启动全部API（默认行为，保留以兼容部署脚本）")
+    parser.add_argument("--host", default=API_SERVER["host"])
+    parser.add_argument("--port", type=int, default=API_SERVER["port"])
+    parser.add_argument("--drain-timeout", type=float, default=API_SERVER["drain_timeout"],
+                        help="退出时等待运行中的模拟结束的最长秒数")
+    parser.add_argument("--reuse-port", action=argparse.BooleanOptionalAction, default=API_SERVER["reuse_port"],
+                        help="以SO_REUSEPORT监听，便于新进程接替旧进程")
+    args = parser.parse_args()
+    app.state.drain_timeout = args.drain_timeout
+
+    config = uvicorn.Config(
+        app,
+        host=args.host,
+        port=args.port,
+        loop="asyncio",
+        timeout_graceful_shutdown=args.drain_timeout,
+    )
+    server = DrainingServer(config)
 
-    uvicorn.run(app, host=host, port=port, loop="asyncio")
\ No newline at end of file
+    sockets = None
+    if args.reuse_port:
+        if hasattr(socket, "SO_REUSEPORT"):
+            sockets = [bind_socket(args.host, args.port)]
+        else:
+            print("警告: 当前平台不支持SO_REUSEPORT，使用普通监听")
+    server.run(sockets=sockets)
@@ -0,0 +1,49 @@
+from server.agents.context_agent import ContextAgent
+
+
+def agent(context):
+    return ContextAgent(context, model_name="deepseek-v3", output_format="delta",
+                        max_rel_delta=0.5, min_delta_cap=5.0)
+
+
+def apply(context, changes):
+    context_agent = agent(context)
+    context_agent._apply_changes({"changes": changes})
+    return context_agent._state.current().to_dict()
+
+
+def test_small_values_capped_relative():
+    context = {"us": {"GDP": 21, "失业率": 5.5, "通胀率": 2.1}}
+    updated = apply(context, [
+        {"country": "us", "indicator": "通胀率", "delta": -4.9},
+        {"country": "us", "indicator": "失业率", "delta": 4.9},
+        {"country": "us", "indicator": "GDP", "delta": -0.3},
+        {"country": "us", "indicator": "通胀率", "delta": 0.2},
+    ])
+    assert updated == {"us": {"GDP": 20.7, "失业率": 5.5, "通胀率": 2.3}}
+
+
+def test_zero_and_missing_values_use_floor():
+    context = {"us": {"import_change_pct": 0.0}, "china": {"import_change_pct": 1.0, "export_change_pct": 2.0}}
+    updated = apply(context, [
+        {"country": "us", "indicator": "import_change_pct", "delta": -4.5},
+        {"country": "us", "indicator": "export_change_pct", "delta": 3.0},
+        {"country": "china", "indicator": "import_change_pct", "delta": 4.0},
+    ])
+    assert updated["us"]["import_change_pct"] == -4.5
+    assert "export_change_pct" not in updated["us"]
+    assert updated["china"]["import_change_pct"] == 1.0
+
+    context_agent = agent({"us": {"import_change_pct": 0.0}})
+    context_agent._apply_changes({"changes": [{"country": "us", "indicator": "import_change_pct", "delta": 6.0}]})
+    assert context_agent._state.current()["us"]["import_change_pct"] == 0.0
+
+
+def test_large_values_capped_relative():
+    context = {"us": {"import_value_billion_usd": 350.0}, "china": {"import_value_billion_usd": 80.0}}
+    updated = apply(context, [
+        {"country": "us", "indicator": "import_value_billion_usd", "delta": -40},
+        {"country": "china", "indicator": "import_value_billion_usd", "delta": -60},
+        {"country": "china", "indicator": "import_value_billion_usd", "delta": float("inf")},
+    ])
+    assert updated == {"us": {"import_value_billion_usd": 310.0}, "china": {"import_value_billion_usd": 80.0}}
@@ -0,0 +1,52 @@
+import numpy as np
+
+from configs import IMPACT_RULES
+from server.agents.impact import ImpactEngine
+
+engine = ImpactEngine(IMPACT_RULES)
+
+
+def effect(action, action_detail=""):
+    row = engine.classify(action, action_detail)
+    return None if row is None else engine._self[row].tolist()
+
+
+def test_catalogue_actions():
+    assert effect("设定/更改关税") == effect("加征关税")
+    assert effect("建立/加入/退出联盟") == effect("加入联盟")
+    assert effect("观望") == [0.0, 0.0, 0.0]
+    assert effect("扩大本土产能") is None
+
+
+def test_detail_does_not_flip_variant():
+    assert effect("设定/更改关税", "加征100%关税，暂不取消对部分商品的豁免") == effect("设定/更改关税")
+    assert effect("建立/加入/退出联盟", "建立联盟以应对美国退出多边协定") == effect("建立/加入/退出联盟")
+    assert effect("提出/接受/拒绝谈判让步", "美方拒绝了上一轮方案，我方提出新的减让") == effect("提出/接受/拒绝谈判让步")
+
+
+def test_variant_in_action_name():
+    assert effect("退出联盟") != effect("加入联盟")
+    assert effect("取消报复性关税") == effect("下调关税")
+    assert effect("取消报复性关税") != effect("实施报复性关税")
+    assert effect("拒绝谈判让步") == [0.0, 0.0, 0.0]
+
+
+def test_negated_variant_keyword():
+    assert effect("暂不取消关税") == effect("设定/更改关税")
+    assert effect("不退出联盟") == effect("加入联盟")
+
+
+def test_targets_from_detail():
+    assert engine.targets("china", "对美国农产品加征关税", ["us", "china", "vietnam"]) == ["us"]
+    assert engine.targets("china", "", ["us", "china", "vietnam"]) == ["us", "vietnam"]
+
+
+def test_apply_batch():
+    values = np.array([[21.0, 5.5, 3.5], [18.0, 5.2, 2.1]])
+    updated, unrecognized = engine.apply(values, ["us", "china"], [
+        ("china", "实施报复性关税", "对美国加征"),
+        ("us", "扩大本土产能", ""),
+    ])
+    assert unrecognized == [1]
+    assert updated.tolist() == [[20.8, 5.5, 3.5], [17.9, 5.4, 2.1]]
+    assert values[0, 0] == 21.0
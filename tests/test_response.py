@@ -0,0 +1,26 @@
+from server.agents.response import AgentResponse, ResponseParser, parse_score
+
+
+def test_parse_score():
+    assert parse_score("85") == 85
+    assert parse_score(" 72.6 ") == 72
+    assert parse_score("高") is None
+    assert parse_score(None) is None
+
+
+def test_non_finite_score_is_invalid():
+    assert parse_score("1e999") is None
+    assert parse_score("inf") is None
+    assert parse_score(float("nan")) is None
+    parser = ResponseParser()
+    assert parser.parse('{"score": 1e999, "action": "观望"}') == (None, None)
+    assert parser.parse('{"score": "inf", "action": "观望"}') == (None, None)
+
+
+def test_parse_fenced_and_repaired():
+    parser = ResponseParser()
+    data, path = parser.parse('```json\n{"score": "80", "action": "观望", "action_detail": ""}\n```')
+    assert path == "fast" and data["action"] == "观望"
+    data, path = parser.parse('{"score": 80, "action": "观望",}')
+    assert path == "repair"
+    assert AgentResponse.from_dict(data).score == 80